@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pendulum  # noqa: E402
+
+import fetch_bigquery_data as bq  # noqa: E402
+
+# CPU time and memory per batch of staging rows: the previous 15-key dict per row plus the
+# pendulum.parse round trip load_data_to_staging applied to both timestamps, against
+# build_staging_row's StagingRow tuples, which are already in their final wire format.
+# Also checks that both produce the same JSON.
+#
+#   python benchmarks/bench_bigquery_staging_rows.py --batch 10000 --repeat 5
+
+
+def synthetic_source_rows(count):
+    first_day = date(2024, 3, 1)
+    for i in range(count):
+        hour = i % 24
+        yield {
+            'Date_start': first_day + timedelta(days=i // 2400),
+            'Date_stop': first_day + timedelta(days=i // 2400),
+            'Account_currency': 'USD',
+            'Account_id': str(1000 + i % 100),
+            'Account_name': f'account_{i % 100}',
+            'Ad_set_id': str(i),
+            'Ad_set_name': f'ad set {i}',
+            'Campaign_id': str(i % 50),
+            'Campaign_name': f'campaign {i % 50}',
+            'Amount_spend': 1.25,
+            'Hourly_stats_aggregated_by_advertiser_time_zone': f'{hour:02d}:00:00 - {hour:02d}:59:59',
+        }
+
+
+# The 15-key dict query_bigquery used to build for every row
+def build_dict_row(row, timezone):
+    date_start = row['Date_start']
+    start_time, end_time = row['Hourly_stats_aggregated_by_advertiser_time_zone'].split(' - ')
+    timezone, formatted_start_time, source_datetime, pacific_datetime, hourly_dimension = \
+        bq.convert_hour_bucket_cached(timezone, date_start, start_time, end_time)
+    return {
+        "date_start": date_start.strftime('%Y-%m-%d'),
+        "date_stop": row['Date_stop'].strftime('%Y-%m-%d'),
+        "account_currency": row['Account_currency'],
+        "account_id": row['Account_id'],
+        "account_name": row['Account_name'],
+        "ad_set_id": row['Ad_set_id'],
+        "ad_set_name": row['Ad_set_name'],
+        "campaign_id": row['Campaign_id'],
+        "campaign_name": row['Campaign_name'],
+        "amount_spend": row['Amount_spend'],
+        "hour": formatted_start_time,
+        "source_datetime": source_datetime,
+        "timezone": timezone,
+        "pacific_datetime": pacific_datetime,
+        "dimension__hourly_stats_aggregated_by_advertiser_time_zone": hourly_dimension
+    }
+
+
+def previous_batch(source_rows, timezone):
+    rows = [build_dict_row(row, timezone) for row in source_rows]
+    # The round trip load_data_to_staging used to apply
+    for row in rows:
+        row["source_datetime"] = pendulum.parse(row["source_datetime"]).to_iso8601_string()
+        row["pacific_datetime"] = pendulum.parse(row["pacific_datetime"]).to_iso8601_string()
+    return rows
+
+
+def current_batch(source_rows, timezone):
+    return [bq.build_staging_row(row, timezone) for row in source_rows]
+
+
+def measure(name, build, source_rows, timezone, repeat):
+    build(source_rows, timezone)  # Warm the conversion cache so only row handling is compared
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        build(source_rows, timezone)
+    elapsed = (time.perf_counter() - started) / repeat
+
+    tracemalloc.start()
+    rows = build(source_rows, timezone)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f'{name:<22} {elapsed * 1000:>9.1f} ms/batch {peak / 1024 / 1024:>9.2f} MiB peak per batch')
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark staging row construction for BigQuery.')
+    parser.add_argument('--batch', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--timezone', default='America/New_York')
+    args = parser.parse_args()
+
+    source_rows = list(synthetic_source_rows(args.batch))
+
+    previous = measure('dict + ISO re-parse', previous_batch, source_rows, args.timezone, args.repeat)
+    current = measure('StagingRow tuples', current_batch, source_rows, args.timezone, args.repeat)
+
+    assert [json.dumps(row) for row in previous] == [json.dumps(row._asdict()) for row in current], \
+        'staging rows differ from the previous wire format'
+    print(f'identical wire format for {len(current)} rows')
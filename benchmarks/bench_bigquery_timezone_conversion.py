@@ -0,0 +1,55 @@
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import fetch_bigquery_data as bq  # noqa: E402
+
+# Rows/sec of the per-row pendulum conversion (convert_hour_bucket, the code query_bigquery used to
+# run for every row) against the memoized convert_hour_bucket_cached, on synthetic hourly rows where
+# several ads share each account-day-hour bucket. Also checks that both produce identical output.
+#
+#   python benchmarks/bench_bigquery_timezone_conversion.py --accounts 50 --days 30 --ads 10
+
+TIMEZONES = ['America/New_York', 'Europe/London', 'Asia/Kolkata', 'Australia/Sydney', None]
+
+
+def synthetic_rows(accounts, days, ads):
+    first_day = date(2024, 3, 1)  # Covers the US DST switch
+    for account in range(accounts):
+        timezone = TIMEZONES[account % len(TIMEZONES)]
+        for day in range(days):
+            date_start = first_day + timedelta(days=day)
+            for hour in range(24):
+                start_time = f'{hour:02d}:00:00'
+                end_time = f'{hour:02d}:59:59'
+                for _ in range(ads):
+                    yield timezone, date_start, start_time, end_time
+
+
+def run(name, convert, rows):
+    started = time.perf_counter()
+    results = [convert(*row) for row in rows]
+    elapsed = time.perf_counter() - started
+    print(f'{name:<12} {len(rows):>9} rows {elapsed:>8.2f} s {len(rows) / elapsed:>12.0f} rows/s')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the BigQuery timezone conversion.')
+    parser.add_argument('--accounts', type=int, default=50)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--ads', type=int, default=10, help='Rows sharing each account-day-hour bucket')
+    args = parser.parse_args()
+
+    rows = list(synthetic_rows(args.accounts, args.days, args.ads))
+
+    per_row = run('per-row', bq.convert_hour_bucket, rows)
+    bq.convert_hour_bucket_cached.cache_clear()
+    memoized = run('memoized', bq.convert_hour_bucket_cached, rows)
+
+    assert per_row == memoized, 'memoized conversion differs from the per-row conversion'
+    print(f'identical output for {len(rows)} rows; cache: {bq.convert_hour_bucket_cached.cache_info()}')
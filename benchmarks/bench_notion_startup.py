@@ -0,0 +1,53 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_ROOT)
+
+# Cold-start latency of fetch_notionIo_data: the time a fresh interpreter needs to import the module,
+# which used to authorize gspread and search Drive for the spreadsheet before doing anything else.
+# With --open-sheet it also times the first get_sheet() call in-process, once looking the spreadsheet
+# up by name and once through the cached key (this needs the service account credentials).
+#
+#   python benchmarks/bench_notion_startup.py --runs 10 --open-sheet
+
+IMPORT_SNIPPET = 'import time; started = time.perf_counter(); import fetch_notionIo_data; ' \
+                 'print(time.perf_counter() - started)'
+
+
+def import_times(runs):
+    times = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], cwd=REPO_ROOT, check=True,
+                                capture_output=True, text=True).stdout
+        times.append(float(output.strip().splitlines()[-1]))
+    return times
+
+
+def time_open_sheet(notion, use_cached_key):
+    notion.client = notion.spreadsheet = notion.sheet = None
+    if not use_cached_key and os.path.exists(notion.SPREADSHEET_KEY_FILE):
+        os.remove(notion.SPREADSHEET_KEY_FILE)
+    started = time.perf_counter()
+    notion.get_sheet()
+    return time.perf_counter() - started
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark fetch_notionIo_data startup.')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--open-sheet', action='store_true', help='Also time opening the sheet (needs credentials)')
+    args = parser.parse_args()
+
+    times = import_times(args.runs)
+    print(f'import         median {statistics.median(times) * 1000:>8.1f} ms  max {max(times) * 1000:>8.1f} ms')
+
+    if args.open_sheet:
+        import fetch_notionIo_data as notion
+
+        print(f'open by name          {time_open_sheet(notion, use_cached_key=False) * 1000:>8.1f} ms')
+        print(f'open by cached key    {time_open_sheet(notion, use_cached_key=True) * 1000:>8.1f} ms')
@@ -0,0 +1,106 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import fetch_upworkAPI_data as upwork  # noqa: E402
+
+# Benchmark of the upwork_data writers against a local MySQL/MariaDB instance:
+#   executemany (store_data_in_mysql), LOAD DATA LOCAL INFILE and multi-row INSERTs
+#   (bulk_load_data_in_mysql). Synthetic rows belong to organization 'benchmark' and are dated in 2000,
+#   so only that window is touched.
+#
+#   python benchmarks/bench_upwork_mysql_writers.py --host 127.0.0.1 --user root --password x \
+#       --database upwork_bench --rows 200000
+
+CREATE_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS upwork_data (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    organization_id VARCHAR(64),
+    date DATE,
+    week VARCHAR(32),
+    month VARCHAR(32),
+    year VARCHAR(32),
+    talent VARCHAR(255),
+    team_name VARCHAR(255),
+    contract_status VARCHAR(64),
+    term_id VARCHAR(64),
+    task VARCHAR(255),
+    task_description TEXT,
+    memo TEXT,
+    total_hours_worked DECIMAL(10, 4),
+    total_online_hours_worked DECIMAL(10, 4),
+    total_offline_hours_worked DECIMAL(10, 4),
+    KEY idx_organization_date (organization_id, date)
+)
+"""
+
+ORGANIZATION_ID = 'benchmark'
+START_DATE = '2000-01-01'
+END_DATE = '2000-12-31'
+
+
+# Build synthetic contractTimeReport pages of page_size edges each
+def synthetic_pages(row_count, page_size=upwork.PAGE_SIZE):
+    edges = []
+    for i in range(row_count):
+        edges.append({'node': {
+            'dateWorkedOn': f'2000-{i % 12 + 1:02d}-{i % 28 + 1:02d}',
+            'weekWorkedOn': '1',
+            'monthWorkedOn': str(i % 12 + 1),
+            'yearWorkedOn': '2000',
+            'freelancer': {'name': f'Freelancer {i % 500}'},
+            'team': {'name': f'Team {i % 20}'},
+            'contract': {'status': 'ACTIVE'},
+            'termId': str(100000 + i % 2000),
+            'task': f'TASK-{i % 300}',
+            'taskDescription': 'Synthetic task\twith tab',
+            'memo': f'Memo {i}\nsecond line',
+            'totalHoursWorked': 1.5,
+            'totalOnlineHoursWorked': 1.0,
+            'totalOfflineHoursWorked': 0.5,
+        }})
+        if len(edges) == page_size:
+            yield edges
+            edges = []
+    if edges:
+        yield edges
+
+
+def run(name, writer, row_count):
+    started = time.perf_counter()
+    succeeded = writer(ORGANIZATION_ID, synthetic_pages(row_count), START_DATE, END_DATE)
+    elapsed = time.perf_counter() - started
+    status = 'ok' if succeeded else 'FAILED'
+    print(f'{name:<24} {row_count:>9} rows {elapsed:>9.2f} s {row_count / elapsed:>12.0f} rows/s  {status}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark upwork_data MySQL writers.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--database', required=True, help='Scratch database; upwork_data is created if missing')
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    upwork.MYSQL_HOST = args.host
+    upwork.MYSQL_USER = args.user
+    upwork.MYSQL_PASSWORD = args.password
+    upwork.MYSQL_DATABASE = args.database
+
+    connection = upwork.connect_mysql()
+    cursor = connection.cursor()
+    cursor.execute(CREATE_TABLE_QUERY)
+    connection.commit()
+    cursor.close()
+    connection.close()
+
+    run('executemany', upwork.store_data_in_mysql, args.rows)
+    run('load_data', upwork.bulk_load_data_in_mysql, args.rows)
+    run('multi-row insert',
+        lambda organization_id, pages, start, end: upwork.bulk_load_data_in_mysql(
+            organization_id, pages, start, end, local_infile=False),
+        args.rows)
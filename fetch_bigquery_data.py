@@ -1,10 +1,21 @@
 import time
 import logging
+import functools
+import argparse
+import json
+import tempfile
+import threading
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from collections import namedtuple, defaultdict
 from google.cloud import bigquery
 from dotenv import load_dotenv
 import pendulum
-import mysql.connector
+from mysql.connector import pooling
 import os
+import sys
+from datetime import timedelta
 
 # Configure logging
 logger = logging.getLogger()
@@ -27,61 +38,158 @@ target_table = 'dummy'
 transformed_table = 'dummy'
 staging_table = 'dummy'
 
+# Account names per IN (...) query when loading timezones, and size of the MySQL connection pool
+timezone_batch_size = 1000
+mysql_pool_size = 2
+mysql_pool = None
+timezone_lookup_lock = threading.Lock()
+# Converted (timezone, date_start, start_time, end_time) buckets kept in memory; a day has 24 per account
+conversion_cache_size = 65536
+# 'load_job' writes staging rows to a newline-delimited JSON file submitted as one load job per run,
+# 'streaming' sends each batch through insert_rows_json
+staging_write_mode = 'load_job'
+# Pipeline: result pages are read, transformed by transform_workers threads and written in batches of
+# staging_batch_size rows; stages are connected by queues of at most pipeline_queue_size items
+transform_workers = 2
+pipeline_queue_size = 8
+staging_batch_size = 10000
+pipeline_stats_interval = 30
+# With read_streams > 1 the source query runs once and its result table is read in that many
+# disjoint row slices, each read and transformed in its own process
+read_streams = 1
+# 'incremental' only reads source rows from incremental_lookback_days before the latest date_start already
+# transformed (the high-water mark); 'full' reconciles the whole table history
+run_mode = 'incremental'
+incremental_lookback_days = 3
+# 'scoped' stages each run in its own table (dropped after the merge, expiring after
+# staging_table_expiration_hours otherwise) and bounds the MERGE to the date_start range it holds;
+# 'full' merges the shared staging table into the whole transformed table and truncates it
+merge_mode = 'scoped'
+staging_table_expiration_hours = 24
+
+staging_schema = [
+    bigquery.SchemaField("date_start", "DATE"),
+    bigquery.SchemaField("date_stop", "DATE"),
+    bigquery.SchemaField("account_currency", "STRING"),
+    bigquery.SchemaField("account_id", "STRING"),
+    bigquery.SchemaField("account_name", "STRING"),
+    bigquery.SchemaField("ad_set_id", "STRING"),
+    bigquery.SchemaField("ad_set_name", "STRING"),
+    bigquery.SchemaField("campaign_id", "STRING"),
+    bigquery.SchemaField("campaign_name", "STRING"),
+    bigquery.SchemaField("amount_spend", "FLOAT64"),
+    bigquery.SchemaField("hour", "STRING"),
+    bigquery.SchemaField("source_datetime", "TIMESTAMP"),
+    bigquery.SchemaField("timezone", "STRING"),
+    bigquery.SchemaField("pacific_datetime", "TIMESTAMP"),
+    bigquery.SchemaField("dimension__hourly_stats_aggregated_by_advertiser_time_zone", "STRING")
+]
+
+# Staging rows are tuples in staging_schema order, already in their final wire format
+StagingRow = namedtuple('StagingRow', [field.name for field in staging_schema])
+
+
+def get_mysql_pool():
+    global mysql_pool
+    if mysql_pool is None:
+        mysql_pool = pooling.MySQLConnectionPool(
+            pool_name="timezones",
+            pool_size=mysql_pool_size,
+            host=os.getenv("MYSQL_HOST"),
+            user=os.getenv("MYSQL_USER"),
+            password=os.getenv("MYSQL_PASSWORD"),
+            database=os.getenv("MYSQL_DATABASE")
+        )
+    return mysql_pool
+
 
+# Raises on MySQL errors, so a failed lookup is never mistaken for accounts without a timezone
 def get_timezones_from_mysql(account_names):
     try:
-        mysql_host = os.getenv("MYSQL_HOST")
-        mysql_user = os.getenv("MYSQL_USER")
-        mysql_password = os.getenv("MYSQL_PASSWORD")
-        mysql_database = os.getenv("MYSQL_DATABASE")
-
-        connection = mysql.connector.connect(
-            host=mysql_host,
-            user=mysql_user,
-            password=mysql_password,
-            database=mysql_database
-        )
+        connection = get_mysql_pool().get_connection()
+        try:
+            cursor = connection.cursor()
+            timezone_dict = {}
+            account_names = list(account_names)
+            for i in range(0, len(account_names), timezone_batch_size):
+                batch = account_names[i:i + timezone_batch_size]
+                format_strings = ','.join(['%s'] * len(batch))
+                query = f"""
+                    SELECT ad_account_code, timezone
+                    FROM mb_accountrelation_main
+                    WHERE ad_account_code IN ({format_strings})
+                """
+                cursor.execute(query, batch)
+                timezone_dict.update({row[0]: row[1] for row in cursor.fetchall()})
+            cursor.close()
+        finally:
+            connection.close()  # Returns the connection to the pool
 
-        cursor = connection.cursor()
-        format_strings = ','.join(['%s'] * len(account_names))
-        query = f"""
-            SELECT ad_account_code, timezone
-            FROM mb_accountrelation_main
-            WHERE ad_account_code IN ({format_strings})
-        """
-        cursor.execute(query, account_names)
+        return timezone_dict
 
-        timezone_dict = {row[0]: row[1] for row in cursor.fetchall()}
+    except Exception as e:
+        logger.error(f"Error fetching timezones from MySQL: {e}")
+        raise
 
-        cursor.close()
-        connection.close()
 
-        return timezone_dict
+def get_high_water_mark(client):
+    # Earliest date_start an incremental run has to read: the latest date_start already transformed minus
+    # incremental_lookback_days, so late-arriving rows of recent days are still picked up.
+    # None means nothing has been transformed yet (or the lookup failed) and the run reads everything.
+    try:
+        query = f"SELECT MAX(date_start) AS high_water_mark FROM `{transformed_table}`"
+        high_water_mark = next(iter(client.query(query).result()))['high_water_mark']
+    except Exception as e:
+        logger.error(f"Error reading the high-water mark of {transformed_table}: {e}")
+        return None
+
+    if high_water_mark is None:
+        return None
+    return high_water_mark - timedelta(days=incremental_lookback_days)
+
 
+# Job config binding @since for queries restricted to Date_start >= since
+def source_query_config(since=None):
+    if since is None:
+        return None
+    return bigquery.QueryJobConfig(query_parameters=[bigquery.ScalarQueryParameter("since", "DATE", since)])
+
+
+def prefetch_timezones(client, since=None):
+    # Load every account's timezone up front so the row loop never waits on MySQL.
+    # Accounts without a timezone are cached as None, which means the Los Angeles default.
+    try:
+        query = f"SELECT DISTINCT Account_name FROM `{target_table}`"
+        if since is not None:
+            query += " WHERE Date_start >= @since"
+        account_names = [row['Account_name'] for row in client.query(query, job_config=source_query_config(since)).result()]
     except Exception as e:
-        logger.error(f"Error fetching timezones from MySQL: {e}")
+        logger.error(f"Error listing account names in BigQuery: {e}")
         return {}
 
+    try:
+        timezone_dict = get_timezones_from_mysql(account_names)
+    except Exception:
+        # Nothing is cached, so every account is looked up on its first row instead
+        logger.warning("Timezone prefetch failed, falling back to per-account lookups.")
+        return {}
+    timezone_cache = {account_name: timezone_dict.get(account_name) for account_name in account_names}
+    logger.info(f"Prefetched timezones for {len(timezone_cache)} accounts "
+                f"({sum(tz is None for tz in timezone_cache.values())} without a timezone).")
+    return timezone_cache
+
+
+# Tables created by this script are partitioned on date_start and clustered on account_id,
+# so date-bounded reads and merges only scan the partitions they touch
+def partitioned_table(table_id):
+    table = bigquery.Table(table_id, schema=staging_schema)
+    table.time_partitioning = bigquery.TimePartitioning(type_=bigquery.TimePartitioningType.DAY, field="date_start")
+    table.clustering_fields = ["account_id"]
+    return table
+
 
 def create_staging_table(client):
-    schema = [
-        bigquery.SchemaField("date_start", "DATE"),
-        bigquery.SchemaField("date_stop", "DATE"),
-        bigquery.SchemaField("account_currency", "STRING"),
-        bigquery.SchemaField("account_id", "STRING"),
-        bigquery.SchemaField("account_name", "STRING"),
-        bigquery.SchemaField("ad_set_id", "STRING"),
-        bigquery.SchemaField("ad_set_name", "STRING"),
-        bigquery.SchemaField("campaign_id", "STRING"),
-        bigquery.SchemaField("campaign_name", "STRING"),
-        bigquery.SchemaField("amount_spend", "FLOAT64"),
-        bigquery.SchemaField("hour", "STRING"),
-        bigquery.SchemaField("source_datetime", "TIMESTAMP"),
-        bigquery.SchemaField("timezone", "STRING"),
-        bigquery.SchemaField("pacific_datetime", "TIMESTAMP"),
-        bigquery.SchemaField("dimension__hourly_stats_aggregated_by_advertiser_time_zone", "STRING")
-    ]
-    table = bigquery.Table(staging_table, schema=schema)
+    table = partitioned_table(staging_table)
 
     try:
         client.get_table(table)  # Check if table exists
@@ -91,6 +199,25 @@ def create_staging_table(client):
         logger.info(f"Created table {staging_table}.")
 
 
+def create_transformed_table(client):
+    try:
+        table = client.get_table(transformed_table)
+        if table.time_partitioning is None:
+            logger.warning(f"Table {transformed_table} is not partitioned; scoped merges will still scan all of it.")
+    except Exception:
+        client.create_table(partitioned_table(transformed_table))
+        logger.info(f"Created table {transformed_table}.")
+
+
+def create_run_staging_table(client):
+    # A fresh staging table for this run; it expires on its own if the run dies before dropping it
+    table = partitioned_table(f"{staging_table}_{pendulum.now('UTC').format('YYYYMMDDHHmmss')}_{os.getpid()}")
+    table.expires = pendulum.now('UTC').add(hours=staging_table_expiration_hours)
+    table = client.create_table(table)
+    logger.info(f"Created run staging table {table.full_table_id}.")
+    return f"{table.project}.{table.dataset_id}.{table.table_id}"
+
+
 def insert_dummy_row_if_needed(client):
         dummy_row = [{
             "date_start": "1900-01-01",
@@ -117,11 +244,249 @@ def insert_dummy_row_if_needed(client):
             logger.warning(f"Error inserting dummy row: {e}")
 
 
-def query_bigquery():
-    client = bigquery.Client()
-    timezone_cache = {}
+def convert_hour_bucket(timezone, date_start, start_time, end_time):
+    # Returns (timezone, hour, source_datetime, pacific_datetime, hourly_stats_dimension)
+    use_default_date = timezone is None
+    timezone = timezone or 'America/Los_Angeles'
+
+    start_hour, start_minute, start_second = map(int, start_time.split(':'))
+    end_hour, end_minute, end_second = map(int, end_time.split(':'))
+
+    if use_default_date:
+        start_time_fetched = pendulum.datetime(1900, 1, 1, start_hour, start_minute, start_second,
+                                               tz='America/Los_Angeles')
+    else:
+        start_time_fetched = pendulum.datetime(date_start.year, date_start.month, date_start.day, start_hour,
+                                               start_minute, start_second, tz=timezone)
+
+    start_time_pacific = start_time_fetched.in_timezone('America/Los_Angeles')
+    formatted_start_time = start_time_pacific.strftime('%H:%M:%S')
+
+    if use_default_date:
+        end_time_fetched = pendulum.datetime(1900, 1, 1, end_hour, end_minute, end_second,
+                                             tz='America/Los_Angeles')
+    else:
+        end_time_fetched = pendulum.datetime(date_start.year, date_start.month, date_start.day, end_hour,
+                                             end_minute, end_second, tz=timezone)
+
+    end_time_pacific = end_time_fetched.in_timezone('America/Los_Angeles')
+    formatted_end_time = end_time_pacific.strftime('%H:%M:%S')
+
+    source_datetime = start_time_fetched.to_iso8601_string()
+    pacific_datetime = start_time_pacific.to_iso8601_string()
+
+    if use_default_date:
+        pacific_datetime = pendulum.datetime(1900, 1, 1, start_hour, start_minute, start_second,
+                                             tz='America/Los_Angeles').to_iso8601_string()
+
+    return timezone, formatted_start_time, source_datetime, pacific_datetime, \
+        f"{formatted_start_time} - {formatted_end_time}"
+
+
+# The output only depends on the bucket, so rows of the same account-day-hour share one conversion
+convert_hour_bucket_cached = functools.lru_cache(maxsize=conversion_cache_size)(convert_hour_bucket)
+
+
+def build_staging_row(row, timezone):
+    date_start = row['Date_start']
+    start_time, end_time = row['Hourly_stats_aggregated_by_advertiser_time_zone'].split(' - ')
+
+    timezone, formatted_start_time, source_datetime, pacific_datetime, hourly_dimension = \
+        convert_hour_bucket_cached(timezone, date_start, start_time, end_time)
+
+    return StagingRow(
+        date_start.strftime('%Y-%m-%d'),
+        row['Date_stop'].strftime('%Y-%m-%d'),
+        row['Account_currency'],
+        row['Account_id'],
+        row['Account_name'],
+        row['Ad_set_id'],
+        row['Ad_set_name'],
+        row['Campaign_id'],
+        row['Campaign_name'],
+        row['Amount_spend'],
+        formatted_start_time,
+        source_datetime,
+        timezone,
+        pacific_datetime,
+        hourly_dimension
+    )
+
+
+def transform_rows(rows, timezone_cache):
+    staging_rows = []
+    for row in rows:
+        account_name = row['Account_name']
+
+        if account_name in timezone_cache:
+            timezone = timezone_cache[account_name]
+        else:
+            # Account added after the prefetch (or the prefetch failed); one lookup at a time so the pool is
+            # never exhausted. A lookup error aborts the transform rather than staging rows with the default.
+            with timezone_lookup_lock:
+                if account_name not in timezone_cache:
+                    timezone_dict = get_timezones_from_mysql([account_name])
+                    timezone_cache[account_name] = timezone_dict.get(account_name, None)
+            timezone = timezone_cache[account_name]
+
+        staging_rows.append(build_staging_row(row, timezone))
+    return staging_rows
+
+
+class PipelineStats:
+    # Per-stage busy/wait seconds and item counts, plus the deepest each queue got
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.busy_seconds = defaultdict(float)
+        self.wait_seconds = defaultdict(float)
+        self.items = defaultdict(int)
+        self.max_depth = defaultdict(int)
+
+    def record(self, stage, busy=0.0, wait=0.0, items=0):
+        with self.lock:
+            self.busy_seconds[stage] += busy
+            self.wait_seconds[stage] += wait
+            self.items[stage] += items
+
+    def observe(self, queues):
+        depths = {name: q.qsize() for name, q in queues.items()}
+        with self.lock:
+            for name, depth in depths.items():
+                self.max_depth[name] = max(self.max_depth[name], depth)
+        return depths
+
+    def summary(self):
+        with self.lock:
+            stages = ', '.join(f"{stage}: {self.items[stage]} items, {self.busy_seconds[stage]:.1f}s busy, "
+                               f"{self.wait_seconds[stage]:.1f}s waiting" for stage in self.items)
+            depths = ', '.join(f"{name} max {depth}" for name, depth in self.max_depth.items())
+        return f"{stages}; queue depth {depths}"
+
+
+def put_item(q, item, failed, stats, stage):
+    started = time.perf_counter()
+    while not failed.is_set():
+        try:
+            q.put(item, timeout=1)
+            stats.record(stage, wait=time.perf_counter() - started)
+            return True
+        except queue.Full:
+            continue
+    return False
+
 
-    query = f"""
+def get_item(q, failed, stats, stage):
+    started = time.perf_counter()
+    while not failed.is_set():
+        try:
+            item = q.get(timeout=1)
+            stats.record(stage, wait=time.perf_counter() - started)
+            return item
+        except queue.Empty:
+            continue
+    raise RuntimeError("Pipeline stopped")
+
+
+def run_pipeline(pages, timezone_cache, staging_writer, workers=None, queue_size=None):
+    # reader -> page_queue -> transform workers -> row_queue -> staging writer. A None item marks
+    # the end of a stream; each transform worker forwards one to the writer when it finishes.
+    workers = workers or transform_workers
+    page_queue = queue.Queue(maxsize=queue_size or pipeline_queue_size)
+    row_queue = queue.Queue(maxsize=queue_size or pipeline_queue_size)
+    queues = {'pages': page_queue, 'rows': row_queue}
+    stats = PipelineStats()
+    failed = threading.Event()
+    done = threading.Event()
+    errors = []
+
+    def stage(name, target):
+        def run():
+            try:
+                target()
+            except Exception as e:
+                if not failed.is_set():
+                    errors.append(e)
+                    logger.error(f"Pipeline {name} stage failed: {e}")
+                failed.set()
+        return threading.Thread(target=run, name=f"pipeline-{name}", daemon=True)
+
+    def read():
+        page_iterator = iter(pages)
+        while True:
+            started = time.perf_counter()
+            page = next(page_iterator, None)
+            rows = list(page) if page is not None else None
+            stats.record('read', busy=time.perf_counter() - started, items=len(rows) if rows else 0)
+            if rows is None:
+                break
+            if not put_item(page_queue, rows, failed, stats, 'read'):
+                return
+        for _ in range(workers):
+            put_item(page_queue, None, failed, stats, 'read')
+
+    def transform():
+        while True:
+            rows = get_item(page_queue, failed, stats, 'transform')
+            if rows is None:
+                put_item(row_queue, None, failed, stats, 'transform')
+                return
+            started = time.perf_counter()
+            staging_rows = transform_rows(rows, timezone_cache)
+            stats.record('transform', busy=time.perf_counter() - started, items=len(staging_rows))
+            if not put_item(row_queue, staging_rows, failed, stats, 'transform'):
+                return
+
+    def write():
+        finished_workers = 0
+        batch = []
+        while finished_workers < workers:
+            staging_rows = get_item(row_queue, failed, stats, 'write')
+            if staging_rows is None:
+                finished_workers += 1
+                continue
+            batch.extend(staging_rows)
+            if len(batch) >= staging_batch_size:
+                started = time.perf_counter()
+                staging_writer.write_rows(batch)
+                stats.record('write', busy=time.perf_counter() - started, items=len(batch))
+                batch = []
+        if batch:
+            started = time.perf_counter()
+            staging_writer.write_rows(batch)
+            stats.record('write', busy=time.perf_counter() - started, items=len(batch))
+
+    def monitor():
+        while not done.wait(pipeline_stats_interval):
+            depths = stats.observe(queues)
+            logger.info(f"Pipeline queue depth: {depths}; {stats.summary()}")
+
+    threads = [stage('read', read)] + [stage(f'transform-{i}', transform) for i in range(workers)]
+    writer_thread = stage('write', write)
+    monitor_thread = threading.Thread(target=monitor, name="pipeline-monitor", daemon=True)
+    for thread in threads + [writer_thread, monitor_thread]:
+        thread.start()
+
+    while writer_thread.is_alive():
+        stats.observe(queues)
+        writer_thread.join(timeout=0.5)
+    failed.set()  # Releases any stage still blocked on a queue
+    for thread in threads:
+        thread.join()
+    done.set()
+
+    logger.info(f"Pipeline finished: {stats.summary()}")
+    if errors:
+        raise errors[0]
+    return stats
+
+
+def build_source_query(since=None):
+    # With since, both sides of the anti-join are restricted to Date_start >= @since so partitions are pruned
+    since_join_filter = "AND tt.date_start >= @since" if since is not None else ""
+    since_filter = "AND t.Date_start >= @since" if since is not None else ""
+
+    return f"""
            SELECT t.*,
                   SPLIT(t.Hourly_stats_aggregated_by_advertiser_time_zone, ' - ')[OFFSET(0)] as start_time,
                   SPLIT(t.Hourly_stats_aggregated_by_advertiser_time_zone, ' - ')[OFFSET(1)] as end_time
@@ -130,134 +495,282 @@ def query_bigquery():
            ON CAST(t.Account_id AS STRING) = tt.account_id
            AND t.Date_start = tt.date_start
            AND SPLIT(t.Hourly_stats_aggregated_by_advertiser_time_zone, ' - ')[OFFSET(0)] = tt.hour
+           {since_join_filter}
            WHERE tt.account_id IS NULL
+           {since_filter}
        """
 
+
+# Returns True only when every source row was transformed and handed to staging_writer; after a
+# failure the staged rows are partial and must not be merged
+def query_bigquery(client, staging_writer, workers=None, queue_size=None, since=None):
+    timezone_cache = prefetch_timezones(client, since)
+
     try:
-        query_job = client.query(query)
+        query_job = client.query(build_source_query(since), job_config=source_query_config(since))
         results = query_job.result(page_size=1000)
 
-        rows_to_insert = []
-
-        for row in results:
-            date_start = row['Date_start']
-            date_stop = row['Date_stop']
-            hourly_stats = row['Hourly_stats_aggregated_by_advertiser_time_zone']
-            account_name = row['Account_name']
-            account_id = row['Account_id']
-            start_time, end_time = hourly_stats.split(' - ')
-
-            if account_name in timezone_cache:
-                timezone = timezone_cache[account_name]
-            else:
-                timezone_dict = get_timezones_from_mysql([account_name])
-                timezone = timezone_dict.get(account_name, None)
-                timezone_cache[account_name] = timezone
-
-            use_default_date = timezone is None
-            timezone = timezone or 'America/Los_Angeles'
-
-            start_hour, start_minute, start_second = map(int, start_time.split(':'))
-            end_hour, end_minute, end_second = map(int, end_time.split(':'))
-
-            if use_default_date:
-                start_time_fetched = pendulum.datetime(1900, 1, 1, start_hour, start_minute, start_second,
-                                                       tz='America/Los_Angeles')
-            else:
-                start_time_fetched = pendulum.datetime(date_start.year, date_start.month, date_start.day, start_hour,
-                                                       start_minute, start_second, tz=timezone)
-
-            start_time_pacific = start_time_fetched.in_timezone('America/Los_Angeles')
-            formatted_start_time = start_time_pacific.strftime('%H:%M:%S')
-
-            if use_default_date:
-                end_time_fetched = pendulum.datetime(1900, 1, 1, end_hour, end_minute, end_second,
-                                                     tz='America/Los_Angeles')
-            else:
-                end_time_fetched = pendulum.datetime(date_start.year, date_start.month, date_start.day, end_hour,
-                                                     end_minute, end_second, tz=timezone)
-
-            end_time_pacific = end_time_fetched.in_timezone('America/Los_Angeles')
-            formatted_end_time = end_time_pacific.strftime('%H:%M:%S')
-
-            source_datetime = start_time_fetched.to_iso8601_string()
-            pacific_datetime = start_time_pacific.to_iso8601_string()
-
-            date_start_new = '1900-01-01' if use_default_date else date_start.strftime('%Y-%m-%d')
-            if use_default_date:
-                pacific_datetime = pendulum.datetime(1900, 1, 1, start_hour, start_minute, start_second,
-                                                     tz='America/Los_Angeles').to_iso8601_string()
-
-            row_to_insert = {
-                "date_start": date_start.strftime('%Y-%m-%d'),
-                "date_stop": date_stop.strftime('%Y-%m-%d'),
-                "account_currency": row['Account_currency'],
-                "account_id": account_id,
-                "account_name": account_name,
-                "ad_set_id": row['Ad_set_id'],
-                "ad_set_name": row['Ad_set_name'],
-                "campaign_id": row['Campaign_id'],
-                "campaign_name": row['Campaign_name'],
-                "amount_spend": row['Amount_spend'],
-                "hour": formatted_start_time,
-                "source_datetime": source_datetime,
-                "timezone": timezone,
-                "pacific_datetime": pacific_datetime,
-                "dimension__hourly_stats_aggregated_by_advertiser_time_zone": f"{formatted_start_time} - {formatted_end_time}"
-            }
-
-            rows_to_insert.append(row_to_insert)
-
-            if len(rows_to_insert) >= 10000:  # Adjust batch size as necessary
-                load_data_to_staging(client, rows_to_insert)
-                rows_to_insert = []
-
-        if rows_to_insert:
-            load_data_to_staging(client, rows_to_insert)
+        # Network reads, timezone conversion and staging writes overlap
+        run_pipeline(results.pages, timezone_cache, staging_writer, workers, queue_size)
+
+        cache_info = convert_hour_bucket_cached.cache_info()
+        logger.info(f"Timezone conversion cache: {cache_info.hits} hits, {cache_info.misses} misses.")
+        return True
 
     except Exception as e:
         logger.error(f"Error querying BigQuery: {e}")
+        return False
 
 
-def load_data_to_staging(client, rows_to_insert):
+def read_and_transform_slice(table_id, start_index, row_count, timezone_cache, out_queue, stop):
+    # Runs in a worker process: reads rows start_index..start_index + row_count of the source query's
+    # result table and sends transformed pages back to the parent. Reading a finished query's table is
+    # not billed. None always follows the last page so the parent can count finished slices.
+    # The parent sets stop when it gives up on the run; the slice then ends after its current page.
     try:
-        # Convert datetime fields to ISO 8601 format for TIMESTAMP
-        for row in rows_to_insert:
-            row["source_datetime"] = pendulum.parse(row["source_datetime"]).to_iso8601_string()
-            row["pacific_datetime"] = pendulum.parse(row["pacific_datetime"]).to_iso8601_string()
+        client = bigquery.Client()
+        rows = client.list_rows(table_id, start_index=start_index, max_results=row_count, page_size=1000)
+        transformed = 0
+        for page in rows.pages:
+            if stop.is_set():
+                logger.info(f"Slice starting at row {start_index} stopped after {transformed} rows.")
+                return transformed
+            staging_rows = transform_rows(list(page), timezone_cache)
+            transformed += len(staging_rows)
+            out_queue.put(staging_rows)
+        logger.info(f"Rows {start_index}-{start_index + transformed - 1} read and transformed.")
+        return transformed
+    finally:
+        out_queue.put(None)
+
+
+# Discard queued pages until every worker has exited, so none stays blocked on a full queue
+def drain_queue(out_queue, futures):
+    while not all(future.done() for future in futures):
+        try:
+            out_queue.get(timeout=1)
+        except queue.Empty:
+            pass
+
+
+# Split row_count rows into at most streams contiguous (start_index, row_count) slices
+def split_row_slices(row_count, streams):
+    if not row_count:
+        return []
+    slice_size = -(-row_count // streams)  # Ceiling division
+    return [(start, min(slice_size, row_count - start)) for start in range(0, row_count, slice_size)]
 
-        # Insert data into the staging table
-        errors = client.insert_rows_json(staging_table, rows_to_insert)
+
+# Same contract as query_bigquery: False when any slice failed
+def query_bigquery_parallel(client, staging_writer, streams=None, since=None):
+    streams = streams or read_streams
+    timezone_cache = prefetch_timezones(client, since)
+
+    try:
+        # The anti-join runs once; the workers only read disjoint slices of its result table
+        query_job = client.query(build_source_query(since), job_config=source_query_config(since))
+        total_rows = query_job.result().total_rows
+        destination = query_job.destination
+        table_id = f"{destination.project}.{destination.dataset_id}.{destination.table_id}"
+        slices = split_row_slices(total_rows, streams)
+        logger.info(f"Source query returned {total_rows} rows, read in {len(slices)} parallel slices.")
+        if not slices:
+            return True
+
+        context = multiprocessing.get_context('spawn')
+        with context.Manager() as manager:
+            out_queue = manager.Queue(maxsize=pipeline_queue_size * len(slices))
+            stop = manager.Event()
+            with ProcessPoolExecutor(max_workers=len(slices), mp_context=context) as executor:
+                futures = [executor.submit(read_and_transform_slice, table_id, start_index, row_count,
+                                           timezone_cache, out_queue, stop)
+                           for start_index, row_count in slices]
+
+                # Every slice's pages go through the same staging writer as the single-stream path
+                finished_slices = 0
+                batch = []
+                try:
+                    while finished_slices < len(slices):
+                        try:
+                            staging_rows = out_queue.get(timeout=1)
+                        except queue.Empty:
+                            if all(future.done() for future in futures):
+                                break  # A worker died without sending its end marker
+                            continue
+                        if staging_rows is None:
+                            finished_slices += 1
+                            continue
+                        batch.extend(staging_rows)
+                        if len(batch) >= staging_batch_size:
+                            staging_writer.write_rows(batch)
+                            batch = []
+                    if batch:
+                        staging_writer.write_rows(batch)
+                except BaseException:
+                    # Leaving the executor block waits for the workers, which may be blocked on the full
+                    # queue: stop them, cancel the slices not started yet and keep draining until all exit
+                    stop.set()
+                    for future in futures:
+                        future.cancel()
+                    drain_queue(out_queue, futures)
+                    raise
+
+                row_count = sum(future.result() for future in futures)  # Re-raises slice errors
+        logger.info(f"{row_count} rows read from {len(slices)} parallel streams.")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error querying BigQuery in parallel: {e}")
+        return False
+
+
+def load_data_to_staging(client, rows_to_insert, table=None):
+    try:
+        # Rows already hold ISO 8601 TIMESTAMP strings, so they are sent as they are
+        errors = client.insert_rows_json(table or staging_table, [row._asdict() for row in rows_to_insert])
 
         if errors:
             logger.error(f"Errors occurred while inserting rows into staging table: {errors}")
-            return
+            return False
 
         logger.info(f"{len(rows_to_insert)} rows inserted into staging table.")
+        return True
 
     except Exception as e:
         logger.error(f"Error loading data into staging table: {e}")
+        return False
+
+
+class StreamingStagingWriter:
+    # Streams every batch into the staging table with insert_rows_json
+
+    def __init__(self, client, table=None):
+        self.client = client
+        self.table = table or staging_table
 
+    def write_rows(self, rows):
+        # Raising stops the run, so a batch that failed to stream is never followed by a merge
+        if not load_data_to_staging(self.client, rows, self.table):
+            raise RuntimeError(f"Streaming {len(rows)} rows into {self.table} failed")
+
+    def finish(self):
+        pass
+
+
+class LoadJobStagingWriter:
+    # Appends every batch to a newline-delimited JSON temp file and loads the file into the
+    # staging table with a single load job in finish(). Only client.load_table_from_file is used,
+    # so tests/test_bigquery_staging_writer.py checks it offline with a fake client.
+
+    def __init__(self, client, table=None):
+        self.client = client
+        self.table = table or staging_table
+        self.file = tempfile.TemporaryFile()
+        self.row_count = 0
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.file.write(json.dumps(row._asdict()).encode('utf-8'))
+            self.file.write(b'\n')
+        self.row_count += len(rows)
+        logger.info(f"{len(rows)} rows written to staging file ({self.row_count} total).")
+
+    def finish(self):
+        try:
+            if not self.row_count:
+                logger.info("No rows to load into staging table.")
+                return
+
+            self.file.seek(0)
+            job_config = bigquery.LoadJobConfig(
+                source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+                schema=staging_schema,
+                write_disposition=bigquery.WriteDisposition.WRITE_APPEND
+            )
+            load_job = self.client.load_table_from_file(self.file, self.table, job_config=job_config)
+            load_job.result()  # Wait for the job to complete
+
+            logger.info(f"{self.row_count} rows loaded into staging table by load job {load_job.job_id}.")
+        except Exception as e:
+            logger.error(f"Error loading data into staging table: {e}")
+        finally:
+            self.file.close()
+
+
+def create_staging_writer(client, mode=None, table=None):
+    if (mode or staging_write_mode) == 'streaming':
+        return StreamingStagingWriter(client, table)
+    return LoadJobStagingWriter(client, table)
+
+
+# (min, max) date_start held by a staging table, None when it is empty
+def get_staging_date_bounds(client, table_id):
+    query = f"SELECT MIN(date_start) AS min_date_start, MAX(date_start) AS max_date_start FROM `{table_id}`"
+    row = next(iter(client.query(query).result()))
+    if row['min_date_start'] is None:
+        return None
+    return row['min_date_start'], row['max_date_start']
+
+
+def merge_staging_to_transformed(client, table_id=None, date_bounds=None):
+    # With date_bounds the ON clause only matches target partitions in that date_start range,
+    # so bytes scanned follow the size of the batch rather than the transformed table
+    table_id = table_id or staging_table
+    date_filter = ""
+    job_config = None
+    if date_bounds is not None:
+        date_filter = "AND target.date_start BETWEEN @min_date_start AND @max_date_start"
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter("min_date_start", "DATE", date_bounds[0]),
+            bigquery.ScalarQueryParameter("max_date_start", "DATE", date_bounds[1]),
+        ])
 
-def merge_staging_to_transformed(client):
     try:
         merge_query = f"""
             MERGE `{transformed_table}` AS target
-            USING `{staging_table}` AS source
+            USING `{table_id}` AS source
             ON target.account_id = source.account_id
             AND target.date_start = source.date_start
             AND target.hour = source.hour
+            {date_filter}
             WHEN NOT MATCHED BY TARGET THEN
                 INSERT (date_start, date_stop, account_currency, account_id, account_name, ad_set_id, ad_set_name, campaign_id, campaign_name, amount_spend, hour, source_datetime, timezone, pacific_datetime, dimension__hourly_stats_aggregated_by_advertiser_time_zone)
                 VALUES (source.date_start, source.date_stop, source.account_currency, source.account_id, source.account_name, source.ad_set_id, source.ad_set_name, source.campaign_id, source.campaign_name, source.amount_spend, source.hour, source.source_datetime, source.timezone, source.pacific_datetime, source.dimension__hourly_stats_aggregated_by_advertiser_time_zone)
         """
 
-        merge_job = client.query(merge_query)
+        merge_job = client.query(merge_query, job_config=job_config)
         merge_job.result()  # Wait for the job to complete
 
-        logger.info(f"Data merged from staging table to transformed table.")
+        logger.info(f"Data merged from staging table to transformed table "
+                    f"({merge_job.total_bytes_processed} bytes processed).")
+        return True
     except Exception as e:
         logger.error(f"Error merging data from staging table to transformed table: {e}")
+        return False
+
+
+def merge_run_staging_table(client, table_id):
+    # Merge a per-run staging table within its date_start bounds, then drop it. On failure the table
+    # is kept for inspection and removed by its expiration.
+    try:
+        date_bounds = get_staging_date_bounds(client, table_id)
+    except Exception as e:
+        logger.error(f"Error reading date_start bounds of {table_id}: {e}")
+        return
+
+    if date_bounds is None:
+        logger.info("Staging table is empty, nothing to merge.")
+    else:
+        logger.info(f"Merging staging rows with date_start between {date_bounds[0]} and {date_bounds[1]}.")
+        if not merge_staging_to_transformed(client, table_id, date_bounds):
+            logger.warning(f"Keeping {table_id} until it expires.")
+            return
+
+    try:
+        client.delete_table(table_id, not_found_ok=True)
+        logger.info(f"Dropped run staging table {table_id}.")
+    except Exception as e:
+        logger.error(f"Error dropping run staging table {table_id}: {e}")
 
 
 def empty_staging_table():
@@ -279,14 +792,59 @@ def empty_staging_table():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Transform BigQuery hourly stats into the transformed table.')
+    parser.add_argument('--staging-writer', choices=['load_job', 'streaming'], default=staging_write_mode,
+                        help='Load staging rows with one load job per run, or stream them with insert_rows_json')
+    parser.add_argument('--transform-workers', type=int, default=transform_workers,
+                        help='Threads converting result pages into staging rows')
+    parser.add_argument('--queue-size', type=int, default=pipeline_queue_size,
+                        help='Maximum items in each queue between pipeline stages')
+    parser.add_argument('--read-streams', type=int, default=read_streams,
+                        help='Read and transform the source query results in this many parallel processes')
+    parser.add_argument('--mode', choices=['incremental', 'full'], default=run_mode,
+                        help='Only read source rows from the high-water mark on, or reconcile the whole history')
+    parser.add_argument('--merge-mode', choices=['scoped', 'full'], default=merge_mode,
+                        help='Stage in a per-run table and merge only its date_start range, or use the shared staging table')
+    args = parser.parse_args()
+
     load_dotenv()
     start_time = time.time()
     logger.info(f"###############################{target_table}  Script started. ##################### {start_time}")
     client = bigquery.Client()
-    create_staging_table(client)
-    insert_dummy_row_if_needed(client)
-    query_bigquery()
-    merge_staging_to_transformed(client)
-    empty_staging_table()
+    create_transformed_table(client)
+    if args.merge_mode == 'scoped':
+        run_staging_table = create_run_staging_table(client)
+    else:
+        create_staging_table(client)
+        insert_dummy_row_if_needed(client)
+        run_staging_table = None
+    staging_writer = create_staging_writer(client, args.staging_writer, run_staging_table)
+    since = get_high_water_mark(client) if args.mode == 'incremental' else None
+    if since is not None:
+        logger.info(f"Incremental run: reading rows with Date_start >= {since}.")
+    else:
+        logger.info("Full run: reading the whole table history.")
+    if args.read_streams > 1:
+        transformed = query_bigquery_parallel(client, staging_writer, args.read_streams, since)
+    else:
+        transformed = query_bigquery(client, staging_writer, args.transform_workers, args.queue_size, since)
+    if not transformed:
+        # The anti-join has no order, so a partial run could merge recent dates while older ones stay
+        # untransformed, and the high-water mark would then never read them again. Nothing is merged.
+        logger.error("Transform did not complete; skipping the staging load and the merge.")
+        if run_staging_table:
+            try:
+                client.delete_table(run_staging_table, not_found_ok=True)
+            except Exception as e:
+                logger.error(f"Error dropping run staging table {run_staging_table}: {e}")
+        else:
+            empty_staging_table()
+        sys.exit(1)
+    staging_writer.finish()
+    if run_staging_table:
+        merge_run_staging_table(client, run_staging_table)
+    else:
+        merge_staging_to_transformed(client)
+        empty_staging_table()
     end_time = time.time()
     logger.info(f"{target_table} Script finished. Execution time: {end_time - start_time} seconds")
@@ -4,7 +4,16 @@ from oauth2client.service_account import ServiceAccountCredentials
 import logging
 import sys
 import time
+import argparse
+import json
+import os
+import queue
+import threading
+from datetime import datetime, timedelta, timezone
+from gspread.utils import rowcol_to_a1
 from gspread_formatting import CellFormat, Color, TextFormat, format_cell_range
+from http_client import get_http_client
+from retry_policy import RetryPolicy
 
 # Configure logging
 logging.basicConfig(
@@ -24,26 +33,85 @@ NOTION_HEADERS = {
     "Content-Type": "application/json",
     "Notion-Version": "2022-06-28"
 }
+# Backoff for transient API failures (connection errors, 429 and 5xx); Notion sends Retry-After on 429
+notion_retry_policy = RetryPolicy(max_attempts=6, base_delay=1.0, max_delay=30.0, total_timeout=300.0)
+# Pooled keep-alive connection to the Notion API; only the prefetch thread queries it
+http_client = get_http_client('Notion', max_per_host=2)
 
+# Incremental sync state: last sync times, the sheet headings and the sheet row of every Notion page
+NOTION_STATE_FILE = 'notion_sync_state.json'
+# A full resync runs at least this often, and whenever the state is missing or the properties change
+FULL_RESYNC_HOURS = 24
+# Removed (archived or trashed) pages are only found by listing every page id, which costs one request
+# per NOTION_PAGE_SIZE pages, so incremental runs do it at most this often; in between, their rows stay
+REMOVAL_SCAN_HOURS = 6
+# last_edited_time is only precise to the minute, so incremental queries overlap the previous run
+INCREMENTAL_OVERLAP_MINUTES = 2
+# Pages per Notion query response (the API maximum), and sheet rows read, diffed and written per block
+NOTION_PAGE_SIZE = 100
+SHEET_BLOCK_ROWS = 500
 
-def fetch_notion_data_new(database_id):
+
+# Yields the results of each query response. With edited_since (ISO 8601), only pages edited on or
+# after it are returned; with filter_properties (property ids), only those properties are included.
+def query_notion_pages(database_id, edited_since=None, filter_properties=None):
     url = f"https://api.notion.com/v1/databases/{database_id}/query"
-    all_data = []
+    params = {'filter_properties': filter_properties} if filter_properties else None
     has_more = True
     next_cursor = None
 
     while has_more:
-        payload = {}
+        payload = {'page_size': NOTION_PAGE_SIZE}
+        if edited_since:
+            payload['filter'] = {'timestamp': 'last_edited_time', 'last_edited_time': {'on_or_after': edited_since}}
         if next_cursor:
             payload['start_cursor'] = next_cursor
 
-        response = requests.post(url, headers=NOTION_HEADERS, json=payload)
+        response = notion_retry_policy.send(lambda: http_client.post(url, headers=NOTION_HEADERS, json=payload, params=params),
+                                            'Notion database query')
         data = response.json()
-        all_data.extend(data.get('results', []))
+        yield data.get('results', [])
 
         next_cursor = data.get('next_cursor')
         has_more = data.get('has_more')
 
+
+# Same as query_notion_pages, but the next response is downloaded in a background thread while the
+# caller handles the current one. Query errors are raised in the caller.
+def iter_notion_pages(database_id, edited_since=None):
+    pages = queue.Queue(maxsize=1)
+
+    def fetch_pages():
+        try:
+            for results in query_notion_pages(database_id, edited_since):
+                pages.put(results)
+            pages.put(None)
+        except Exception as e:
+            pages.put(e)
+
+    threading.Thread(target=fetch_pages, daemon=True).start()
+    while True:
+        item = pages.get()
+        if item is None:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+# Ids of every page currently in the database; archived and trashed pages are not returned. Only the
+# title property is requested, so this is much lighter than a full query.
+def list_notion_page_ids(database_id):
+    page_ids = set()
+    for results in query_notion_pages(database_id, filter_properties=['title']):
+        page_ids.update(result.get('id') for result in results)
+    return page_ids
+
+
+def fetch_notion_data_new(database_id, edited_since=None):
+    all_data = []
+    for results in query_notion_pages(database_id, edited_since):
+        all_data.extend(results)
     return {'results': all_data}
 
 
@@ -54,114 +122,432 @@ def fetch_notion_data_new(database_id):
 scope = ["https://spreadsheets.google.com/feeds", 'https://www.googleapis.com/auth/spreadsheets',
          "https://www.googleapis.com/auth/drive.file", "https://www.googleapis.com/auth/drive"]
 
-creds = ServiceAccountCredentials.from_json_keyfile_name('dummy', scope)
-client = gspread.authorize(creds)
+GOOGLE_KEYFILE = 'dummy'
+SPREADSHEET_NAME = "Notion_Data"
+# Key of the spreadsheet, saved after the first lookup by name so later runs open it without a Drive search
+SPREADSHEET_KEY_FILE = 'notion_spreadsheet_key.txt'
+
+# Created on first use, so importing the module makes no network calls
+client = None
+spreadsheet = None
+sheet = None
+
+
+def get_client():
+    global client
+    if client is None:
+        creds = ServiceAccountCredentials.from_json_keyfile_name(GOOGLE_KEYFILE, scope)
+        client = gspread.authorize(creds)
+    return client
+
+
+def read_spreadsheet_key(key_file=SPREADSHEET_KEY_FILE):
+    try:
+        with open(key_file) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_spreadsheet_key(key, key_file=SPREADSHEET_KEY_FILE):
+    temp_file = f"{key_file}.tmp"
+    with open(temp_file, 'w') as f:
+        f.write(key)
+    os.replace(temp_file, key_file)
+
+
+# Open the Google Sheet by its cached key, falling back to the name lookup when there is no key
+# or it no longer resolves
+def get_spreadsheet():
+    global spreadsheet
+    if spreadsheet is None:
+        key = read_spreadsheet_key()
+        if key:
+            try:
+                spreadsheet = get_client().open_by_key(key)
+            except gspread.exceptions.SpreadsheetNotFound:
+                logging.warning(f"Cached spreadsheet key {key} not found, looking up {SPREADSHEET_NAME} by name.")
+        if spreadsheet is None:
+            spreadsheet = get_client().open(SPREADSHEET_NAME)
+            write_spreadsheet_key(spreadsheet.id)
+    return spreadsheet
+
+
+def get_sheet():
+    global sheet
+    if sheet is None:
+        sheet = get_spreadsheet().sheet1  # Get the first sheet
+    return sheet
 
-# Open the Google Sheet
-spreadsheet = client.open("Notion_Data")
-sheet = spreadsheet.sheet1  # Get the first sheet
 
+# Property names of a page, used as the sheet headings
+def get_headings(result):
+    return list(result.get('properties', {}).keys())
 
-# Function to update Google Sheet with Notion data
-def update_google_sheet(data):
-    rows = []
-    headings = []
-    row_number = 1
 
-    # Extract headings from the first result
-    first_result = data.get('results', [{}])[0]
-    properties = first_result.get('properties', {})
-    # Clear the sheet before updating
-    sheet.clear()
+# One sheet row per Notion page
+def build_row(result):
+    row = []
+    prop_number = 1
+    properties = result.get('properties', {})
     for prop, value in properties.items():
-        headings.append(prop)  # Use property names as headings
-
-    # Append headings as the first row
-    sheet.append_row(headings)
-
-    # Format the heading row
-    format_cell_range(sheet, '1:1', CellFormat(
-        backgroundColor=Color(0.678, 0.847, 0.902),
-        textFormat=TextFormat(bold=True),
-        horizontalAlignment='CENTER'
-    ))
-
-    # Append data rows
-    for result in data.get('results', []):
-        row = []
-        prop_number = 1
-        properties = result.get('properties', {})
-        for prop, value in properties.items():
-            # if row_number == 2:
-            #     logging.error(f' prop : {prop}')
-            #     logging.error(f' value : {value}')
-            # logging.info(f'################## : {prop_number} : ##################')
-            prop_number = prop_number + 1
-            value_type = value.get('type')
-
-            if value_type == 'title':
-                title_content = value.get('title', [])
-                if title_content:
-                    row.append(title_content[0].get('plain_text', ''))
-                else:
-                    row.append('')
-            elif value_type == 'rich_text':
-                rich_text_content = value.get('rich_text', [])
-                if rich_text_content:
-                    row.append(rich_text_content[0].get('plain_text', ''))
-                else:
-                    row.append('')
-            elif value_type == 'multi_select':
-                multi_select_content = value.get('multi_select', [])
-                row.append(', '.join([item.get('name', '') for item in multi_select_content]))
-            elif value_type == 'date':
-                date_content = value.get('date', {})
-                if date_content:
-                    row.append(date_content.get('start', ''))
-                else:
-                    row.append('')
-            elif value_type == 'relation':
-                relation_content = value.get('relation', [])
-                row.append(', '.join([item.get('id', '') for item in relation_content]))
-            elif value_type == 'rollup':
-                rollup_content = value.get('rollup', {})
-                rollup_array = rollup_content.get('array', [])
-                if rollup_array:
-                    row.append(', '.join([item.get('name', '') for item in rollup_array]))
-                else:
-                    row.append('')
-            elif value_type == 'checkbox':
-                row.append(str(value.get('checkbox', False)))
-            elif value_type == 'files':
-                files_content = value.get('files', [])
-                row.append(', '.join([file.get('name', '') for file in files_content]))
-            elif value_type in ['number', 'url', 'email', 'phone_number']:
-                row.append(value.get(value_type, ''))
-            elif value_type in ['select', 'status']:
-                content = value.get(value_type, {})
-                if content:
-                    row.append(content.get('name', ''))
-                else:
-                    row.append('')
+        # if row_number == 2:
+        #     logging.error(f' prop : {prop}')
+        #     logging.error(f' value : {value}')
+        # logging.info(f'################## : {prop_number} : ##################')
+        prop_number = prop_number + 1
+        value_type = value.get('type')
+
+        if value_type == 'title':
+            title_content = value.get('title', [])
+            if title_content:
+                row.append(title_content[0].get('plain_text', ''))
+            else:
+                row.append('')
+        elif value_type == 'rich_text':
+            rich_text_content = value.get('rich_text', [])
+            if rich_text_content:
+                row.append(rich_text_content[0].get('plain_text', ''))
+            else:
+                row.append('')
+        elif value_type == 'multi_select':
+            multi_select_content = value.get('multi_select', [])
+            row.append(', '.join([item.get('name', '') for item in multi_select_content]))
+        elif value_type == 'date':
+            date_content = value.get('date', {})
+            if date_content:
+                row.append(date_content.get('start', ''))
+            else:
+                row.append('')
+        elif value_type == 'relation':
+            relation_content = value.get('relation', [])
+            row.append(', '.join([item.get('id', '') for item in relation_content]))
+        elif value_type == 'rollup':
+            rollup_content = value.get('rollup', {})
+            rollup_array = rollup_content.get('array', [])
+            if rollup_array:
+                row.append(', '.join([item.get('name', '') for item in rollup_array]))
+            else:
+                row.append('')
+        elif value_type == 'checkbox':
+            row.append(str(value.get('checkbox', False)))
+        elif value_type == 'files':
+            files_content = value.get('files', [])
+            row.append(', '.join([file.get('name', '') for file in files_content]))
+        elif value_type in ['number', 'url', 'email', 'phone_number']:
+            row.append(value.get(value_type, ''))
+        elif value_type in ['select', 'status']:
+            content = value.get(value_type, {})
+            if content:
+                row.append(content.get('name', ''))
+            else:
+                row.append('')
+        else:
+            row.append(value.get('id', ''))
+
+    # Swap the first and last column in the row
+    if row:
+        row[0], row[-1] = row[-1], row[0]
+
+    return row
+
+
+# Pad a row with empty strings up to the number of headings
+def pad_row(row, width):
+    while len(row) < width:
+        row.append('')
+    return row
+
+
+# A cell value as read_sheet_rows returns it. Cells are written RAW and read back UNFORMATTED_VALUE, so
+# strings stay strings and numbers come back as the same double (an int when it has no fraction).
+def normalize_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+# Whether a value read from the sheet equals the value about to be written, types included (True is not 1)
+def cells_equal(old_value, new_value):
+    old_value, new_value = normalize_cell(old_value), normalize_cell(new_value)
+    return type(old_value) is type(new_value) and old_value == new_value
+
+
+# Ranges of cells that differ between the current sheet values and the target matrix, both starting at
+# sheet row first_row, for one batch_update. Changed cells are grouped into runs per row, and runs spanning
+# the same columns on consecutive rows are merged into one block. Cells beyond the target are cleared.
+def diff_ranges(current, target, first_row=1):
+    height = max(len(current), len(target))
+    width = max([len(row) for row in current] + [len(row) for row in target] + [0])
+    blocks = []  # [first_row, first_col, values], zero-based
+
+    for r in range(height):
+        old_row = current[r] if r < len(current) else []
+        new_row = target[r] if r < len(target) else []
+        c = 0
+        while c < width:
+            old_value = old_row[c] if c < len(old_row) else ''
+            new_value = new_row[c] if c < len(new_row) else ''
+            if cells_equal(old_value, new_value):
+                c += 1
+                continue
+
+            first_col = c
+            values = []
+            while c < width:
+                old_value = old_row[c] if c < len(old_row) else ''
+                new_value = new_row[c] if c < len(new_row) else ''
+                if cells_equal(old_value, new_value):
+                    break
+                values.append('' if new_value is None else new_value)
+                c += 1
+
+            previous = blocks[-1] if blocks else None
+            if (previous and previous[1] == first_col and len(previous[2][0]) == len(values)
+                    and previous[0] + len(previous[2]) == r):
+                previous[2].append(values)
             else:
-                row.append(value.get('id', ''))
+                blocks.append([r, first_col, [values]])
+
+    return [{'range': f"{rowcol_to_a1(first_row + r, c + 1)}:"
+                      f"{rowcol_to_a1(first_row + r + len(values) - 1, c + len(values[0]))}",
+             'values': values}
+            for r, c, values in blocks]
 
-        # Swap the first and last column in the row
-        if row:
-            row[0], row[-1] = row[-1], row[0]
 
-        rows.append(row)
-        row_number += 1
-    logging.info(f'Rows to be updated in Google Sheet: {len(rows)}')
+# Grow the sheet grid when the values to write do not fit in it
+def ensure_grid_size(row_count, col_count):
+    sheet = get_sheet()
+    if row_count > sheet.row_count:
+        sheet.add_rows(row_count - sheet.row_count)
+    if col_count > sheet.col_count:
+        sheet.add_cols(col_count - sheet.col_count)
 
-    # Pad rows with empty strings
-    for row in rows:
-        while len(row) < len(headings):
-            row.append('')
 
-    # Insert the data into the sheet
-    sheet.update(rows, 'A2')  # Batch update
+# Current unformatted values of sheet rows first_row..last_row, across the whole grid width
+def read_sheet_rows(first_row, last_row):
+    sheet = get_sheet()
+    last_row = min(last_row, sheet.row_count)
+    if first_row > last_row:
+        return []
+    return sheet.get(f"A{first_row}:{rowcol_to_a1(last_row, sheet.col_count)}",
+                     value_render_option='UNFORMATTED_VALUE')
+
+
+# Whether the sheet's first row, as read in current, differs from the headings
+def heading_changed(current, headings):
+    if not current:
+        return True
+    headings = pad_row(list(headings), len(current[0]))
+    return len(current[0]) != len(headings) or not all(map(cells_equal, current[0], headings))
+
+
+# Diff one block of rows starting at first_row against the sheet and write the changes;
+# returns the current values that were read
+def flush_block(block, first_row, width):
+    current = read_sheet_rows(first_row, first_row + len(block) - 1)
+    updates = diff_ranges(current, block, first_row)
+    if updates:
+        ensure_grid_size(first_row + len(block) - 1, width)
+        get_sheet().batch_update(updates)
+    return current, len(updates)
+
+
+# Function to update Google Sheet with Notion data; returns the headings and the sheet row of every page.
+# Query responses are turned into rows and flushed in blocks of SHEET_BLOCK_ROWS, each diffed against the
+# same rows of the sheet, so memory stays bounded and unchanged cells are never written.
+def update_google_sheet(pages):
+    row_indexes = {}
+    headings = None
+    block = []
+    block_first_row = 1
+    next_row = 1
+    range_count = 0
+    header_changed = False
+
+    for results in pages:
+        for result in results:
+            if headings is None:
+                # Extract headings from the first result
+                headings = get_headings(result)
+                block.append(headings)
+                next_row += 1
+            block.append(pad_row(build_row(result), len(headings)))
+            row_indexes[result.get('id')] = next_row
+            next_row += 1
+
+            if len(block) >= SHEET_BLOCK_ROWS:
+                current, written = flush_block(block, block_first_row, len(headings))
+                if block_first_row == 1:
+                    header_changed = heading_changed(current, headings)
+                range_count += written
+                block_first_row = next_row
+                block = []
+
+    if headings is None:
+        logging.warning('Notion query returned no pages, leaving the sheet unchanged.')
+        return [], {}
+
+    if block:
+        current, written = flush_block(block, block_first_row, len(headings))
+        if block_first_row == 1:
+            header_changed = heading_changed(current, headings)
+        range_count += written
+
+    # Clear stale rows left below the data by a previous, longer sync
+    stale_row = next_row
+    while True:
+        current = read_sheet_rows(stale_row, stale_row + SHEET_BLOCK_ROWS - 1)
+        if not current:
+            break
+        updates = diff_ranges(current, [], stale_row)
+        if updates:
+            get_sheet().batch_update(updates)
+            range_count += len(updates)
+        stale_row += SHEET_BLOCK_ROWS
+
+    logging.info(f'Google Sheet updated: {next_row - 2} rows, {range_count} changed ranges written.')
+
+    # Format the heading row when it changed
+    if header_changed:
+        format_cell_range(get_sheet(), '1:1', CellFormat(
+            backgroundColor=Color(0.678, 0.847, 0.902),
+            textFormat=TextFormat(bold=True),
+            horizontalAlignment='CENTER'
+        ))
+
+    return headings, row_indexes
+
+
+# Update the rows of changed pages in place, append new pages and delete the rows of removed pages
+def apply_page_changes(results, state, removed_page_ids):
+    headings = state['headings']
+    row_indexes = state['row_indexes']
+    next_row = max(row_indexes.values(), default=1) + 1
+    updates = []
+    removed = [page_id for page_id in removed_page_ids if page_id in row_indexes]
+
+    for result in results:
+        page_id = result.get('id')
+        if page_id in removed_page_ids:
+            continue  # Removed after the changes were queried
+        if page_id not in row_indexes:
+            row_indexes[page_id] = next_row
+            next_row += 1
+        updates.append({'range': f'A{row_indexes[page_id]}', 'values': [pad_row(build_row(result), len(headings))]})
+
+    if updates:
+        ensure_grid_size(next_row - 1, len(headings))
+        get_sheet().batch_update(updates)
+
+    # Delete from the bottom up and shift the rows below each deleted one
+    for page_id in sorted(removed, key=row_indexes.get, reverse=True):
+        deleted_row = row_indexes.pop(page_id)
+        get_sheet().delete_rows(deleted_row)
+        for other_page_id, index in row_indexes.items():
+            if index > deleted_row:
+                row_indexes[other_page_id] = index - 1
+
+    logging.info(f'Incremental sync: {len(updates)} rows updated or added, {len(removed)} rows deleted.')
+
+
+def read_sync_state(state_file=NOTION_STATE_FILE):
+    try:
+        with open(state_file) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable sync state {state_file}: {e}")
+        return None
+
+
+def write_sync_state(state, state_file=NOTION_STATE_FILE):
+    temp_file = f"{state_file}.tmp"
+    with open(temp_file, 'w') as f:
+        json.dump(state, f)
+    os.replace(temp_file, state_file)
+
+
+def clear_sync_state(state_file=NOTION_STATE_FILE):
+    try:
+        os.remove(state_file)
+    except FileNotFoundError:
+        pass
+
+
+def needs_full_resync(state, now):
+    if not state or not state.get('headings') or not state.get('last_full_sync'):
+        return True
+    return now - datetime.fromisoformat(state['last_full_sync']) >= timedelta(hours=FULL_RESYNC_HOURS)
+
+
+# A full sync rewrites every row, so it counts as a removal scan
+def needs_removal_scan(state, now):
+    last_scan = state.get('last_removal_scan') or state['last_full_sync']
+    return now - datetime.fromisoformat(last_scan) >= timedelta(hours=REMOVAL_SCAN_HOURS)
+
+
+def full_sync(now):
+    try:
+        headings, row_indexes = update_google_sheet(iter_notion_pages(NOTION_DATABASE_ID))
+    except Exception:
+        # Rows may already have moved, so the previous row map can no longer be trusted
+        clear_sync_state()
+        raise
+    write_sync_state({
+        'last_sync': now.isoformat(),
+        'last_full_sync': now.isoformat(),
+        'last_removal_scan': now.isoformat(),
+        'headings': headings,
+        'row_indexes': row_indexes
+    })
+
+
+# Returns False when the properties changed and a full resync is needed instead
+def incremental_sync(state, now):
+    edited_since = datetime.fromisoformat(state['last_sync']) - timedelta(minutes=INCREMENTAL_OVERLAP_MINUTES)
+    notion_data = fetch_notion_data_new(NOTION_DATABASE_ID, edited_since.isoformat())
+    results = notion_data.get('results', [])
+
+    if any(get_headings(result) != state['headings'] for result in results):
+        logging.info('Notion properties changed since the last full sync.')
+        return False
+
+    # The query never returns archived or trashed pages, so removals are the mapped pages no longer listed
+    scan_removals = needs_removal_scan(state, now)
+    removed_page_ids = set()
+    if scan_removals:
+        removed_page_ids = set(state['row_indexes']) - list_notion_page_ids(NOTION_DATABASE_ID)
+
+    try:
+        apply_page_changes(results, state, removed_page_ids)
+    except Exception:
+        # The sheet may be partly updated, so the row map can no longer be trusted
+        clear_sync_state()
+        raise
+
+    state['last_sync'] = now.isoformat()
+    if scan_removals:
+        state['last_removal_scan'] = now.isoformat()
+    write_sync_state(state)
+    return True
+
 
 if __name__ == "__main__":
-    notion_data = fetch_notion_data_new(NOTION_DATABASE_ID)
-    update_google_sheet(notion_data)
+    parser = argparse.ArgumentParser(description='Sync a Notion database into Google Sheets.')
+    parser.add_argument('--full', action='store_true', help='Resync the whole database instead of only the pages edited since the last run')
+    args = parser.parse_args()
+
+    now = datetime.now(timezone.utc)
+    state = None if args.full else read_sync_state()
+    try:
+        if needs_full_resync(state, now) or not incremental_sync(state, now):
+            full_sync(now)
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Error fetching data from Notion: {e}")
+        sys.exit(1)
+    finally:
+        http_client.log_stats()
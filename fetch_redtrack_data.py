@@ -1,9 +1,14 @@
-import requests
 import mysql.connector
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from datetime import datetime, timedelta
 import argparse
+import threading
 import time
 import logging
+from http_client import get_http_client
+from mysql_bulk import insert_rows_multirow, load_rows_from_file
+from retry_policy import RetryPolicy
 
 # Configure logging
 logging.basicConfig(
@@ -25,63 +30,195 @@ MYSQL_DB = 'dummy'
 MYSQL_USER = 'dummy'
 MYSQL_PASSWORD = 'dummy'
 
+# Number of days fetched concurrently and the token bucket limiting RedTrack API requests:
+# REQUESTS_PER_SECOND sustained, with bursts of up to BURST_SIZE requests
+FETCH_WORKERS = 4
+REQUESTS_PER_SECOND = 0.5
+BURST_SIZE = 2
 
-def fetch_redtrack_data(from_date, to_date):
+# Backoff for transient API failures (connection errors, 429 and 5xx); every attempt also waits
+# for the rate limiter
+retry_policy = RetryPolicy(max_attempts=5, base_delay=2.0, max_delay=60.0, total_timeout=300.0)
+# Pooled keep-alive connections to the RedTrack API
+http_client = get_http_client('RedTrack')
+
+# Range mode requests up to RANGE_CHUNK_DAYS consecutive days per API call, grouped by date and
+# campaign, and splits the records per day on RANGE_DATE_FIELD
+RANGE_CHUNK_DAYS = 31
+RANGE_GROUP = 'date,campaign'
+RANGE_DATE_FIELD = 'date'
+
+# Rows per multi-row INSERT; with --load-data each day is loaded with LOAD DATA LOCAL INFILE instead,
+# falling back to multi-row INSERTs when the server or the client refuses local infile
+INSERT_BATCH_SIZE = 1000
+CAMPAIGN_METRICS_COLUMNS = ('date', 'campaign_name', 'revenue', 'cost')
+
+
+# Thread-safe token bucket; acquire() blocks until a request may be sent. rate must be positive and
+# capacity at least 1, otherwise acquire() would divide by zero or never get a whole token.
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        if rate <= 0 or capacity < 1:
+            raise ValueError(f"TokenBucket needs rate > 0 and capacity >= 1, got {rate} and {capacity}")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# Returns the API records, or None when the request failed
+def fetch_redtrack_data(from_date, to_date, group='campaign', rate_limiter=None):
     headers = {
         'accept': 'application/json'
     }
     params = {
         'api_key': API_KEY,
-        'group': 'campaign',
+        'group': group,
         'date_from': from_date,
         'date_to': to_date
     }
 
-    try:
-        response = requests.get(API_URL, headers=headers, params=params)
+    def send():
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        return http_client.get(API_URL, headers=headers, params=params)
 
-        if response.status_code == 200:
-            return response.json()
-        else:
-            logging.error(f"Error: Request failed with status code {response.status_code}")
+    try:
+        response = retry_policy.send(send, f'RedTrack request {from_date} to {to_date}')
+        return response.json()
 
     except Exception as e:
         logging.error(f"Error occurred: {e}")
 
-    return []
+    return None
 
 
-def insert_data_into_mysql(connection, data, date):
+# Dates between start_date and end_date that already have rows in campaign_metrics
+def get_loaded_dates(connection, start_date, end_date):
     cursor = connection.cursor()
     try:
-        # Check if data for the given date already exists
-        check_sql = "SELECT COUNT(*) FROM campaign_metrics WHERE date = %s"
-        cursor.execute(check_sql, (date,))
-        if cursor.fetchone()[0] > 0:
-            logging.info(f"Data for date {date} already exists in the database. Skipping...")
-            return
-
-        logging.info(f'Data found for date {current_date_str}')
-        total_inserted_rows = 0
-
-        for record in data:
-            campaign_name = record.get('campaign', 'N/A')
-            revenue = record.get('total_revenue', 0)
-            cost = record.get('cost', 0)
-
-            sql = (f"INSERT INTO campaign_metrics (date, campaign_name, revenue, cost) "
-                   f" VALUES (%s, %s, %s, %s)")
-            cursor.execute(sql, (date, campaign_name, revenue, cost))
-            total_inserted_rows += 1
+        cursor.execute("SELECT DISTINCT date FROM campaign_metrics WHERE date BETWEEN %s AND %s",
+                       (start_date, end_date))
+        return {row[0].strftime('%Y-%m-%d') for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def insert_data_into_mysql(connection, data, date, batch_size=INSERT_BATCH_SIZE, use_load_data=False):
+    cursor = connection.cursor()
+    try:
+        logging.info(f'Data found for date {date}')
+        started = time.perf_counter()
+
+        # Dates that are already loaded are skipped before fetching, so reaching this point means
+        # the day is new or is being reloaded; replace it in the same transaction as the insert
+        cursor.execute("DELETE FROM campaign_metrics WHERE date = %s", (date,))
+
+        rows = [
+            (date, record.get('campaign', 'N/A'), record.get('total_revenue', 0), record.get('cost', 0))
+            for record in data
+        ]
+        if use_load_data:
+            load_rows_from_file(cursor, 'campaign_metrics', CAMPAIGN_METRICS_COLUMNS, rows, batch_size)
+        else:
+            insert_rows_multirow(cursor, 'campaign_metrics', CAMPAIGN_METRICS_COLUMNS, rows, batch_size)
 
         connection.commit()
-        logging.info(f"{total_inserted_rows} records inserted successfully into MySQL for date {date}")
+        elapsed = time.perf_counter() - started
+        logging.info(f"{len(rows)} records inserted successfully into MySQL for date {date} "
+                     f"in {elapsed:.2f}s ({len(rows) / max(elapsed, 1e-6):.0f} rows/sec)")
+        return len(rows)
 
     except mysql.connector.Error as e:
+        connection.rollback()  # Keep the day all-or-nothing
         logging.error(f"Error inserting data into MySQL: {e}")
 
     finally:
         cursor.close()
+    return 0
+
+
+# Fetch a date range; a failed request and an empty report both yield no records
+def fetch_range(from_date, to_date, rate_limiter, group='campaign'):
+    redtrack_data = fetch_redtrack_data(from_date, to_date, group, rate_limiter)
+    if redtrack_data is None:
+        logging.error(f'Failed to fetch data for {from_date} to {to_date}.')
+        return []
+    if not redtrack_data:
+        logging.warning(f'No data found for {from_date} to {to_date}.')
+    return redtrack_data
+
+
+# Fetch a chunk of consecutive dates and return {date: records}. A one-day chunk is fetched
+# grouped by campaign only; longer chunks are fetched in one call grouped by date and campaign.
+def fetch_chunk(dates, rate_limiter):
+    if len(dates) == 1:
+        return {dates[0]: fetch_range(dates[0], dates[0], rate_limiter)}
+
+    data_by_date = {}
+    for record in fetch_range(dates[0], dates[-1], rate_limiter, RANGE_GROUP):
+        record_date = str(record.get(RANGE_DATE_FIELD) or '')[:10]
+        if record_date in dates:
+            data_by_date.setdefault(record_date, []).append(record)
+        else:
+            logging.warning(f'Skipping record with unexpected date {record_date!r} for {dates[0]} to {dates[-1]}')
+    return data_by_date
+
+
+# Split sorted dates into chunks of at most chunk_days consecutive days
+def split_into_chunks(dates, chunk_days):
+    chunks = []
+    previous_date_dt = None
+    for date in dates:
+        date_dt = datetime.strptime(date, '%Y-%m-%d')
+        if (not chunks or len(chunks[-1]) >= chunk_days
+                or date_dt - previous_date_dt != timedelta(days=1)):
+            chunks.append([])
+        chunks[-1].append(date)
+        previous_date_dt = date_dt
+    return chunks
+
+
+# Fetch chunks concurrently and yield (chunk, data_by_date) in date order, keeping a bounded number in flight
+def fetch_chunks_in_order(chunks, workers, rate_limiter):
+    chunks = iter(chunks)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((chunk, executor.submit(fetch_chunk, chunk, rate_limiter)))
+            if len(pending) >= workers * 2:
+                break
+
+        while pending:
+            chunk, future = pending.popleft()
+            next_chunk = next(chunks, None)
+            if next_chunk is not None:
+                pending.append((next_chunk, executor.submit(fetch_chunk, next_chunk, rate_limiter)))
+            yield chunk, future.result()
+
+
+# List the dates from start_date to end_date inclusive as YYYY-MM-DD strings
+def get_dates(start_date, end_date):
+    current_date_dt = datetime.strptime(start_date, '%Y-%m-%d')
+    end_date_dt = datetime.strptime(end_date, '%Y-%m-%d')
+    dates = []
+    while current_date_dt <= end_date_dt:
+        dates.append(current_date_dt.strftime('%Y-%m-%d'))
+        current_date_dt += timedelta(days=1)
+    return dates
 
 
 if __name__ == "__main__":
@@ -89,12 +226,33 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Fetch and store RedTrack data.')
     parser.add_argument('start_date', type=str, help='Start date in YYYY-MM-DD format')
     parser.add_argument('end_date', type=str, help='End date in YYYY-MM-DD format')
+    parser.add_argument('--workers', type=int, default=FETCH_WORKERS,
+                        help='Number of days (or range chunks) fetched concurrently')
+    parser.add_argument('--rate', type=float, default=REQUESTS_PER_SECOND,
+                        help='Sustained RedTrack API requests per second')
+    parser.add_argument('--burst', type=int, default=BURST_SIZE, help='Maximum burst of RedTrack API requests')
+    parser.add_argument('--batch-size', type=int, default=INSERT_BATCH_SIZE, help='Rows per multi-row INSERT')
+    parser.add_argument('--load-data', action='store_true',
+                        help='Load each day with LOAD DATA LOCAL INFILE (for very large ranges)')
+    parser.add_argument('--force', action='store_true', help='Reload every day in the range, even if already loaded')
+    parser.add_argument('--refresh-last', type=int, default=0, metavar='N',
+                        help='Reload the last N days of the range even if already loaded')
+    parser.add_argument('--range-mode', action='store_true',
+                        help='Fetch several days per API call, grouped by date and campaign')
+    parser.add_argument('--chunk-days', type=int, default=RANGE_CHUNK_DAYS,
+                        help='Maximum number of days per API call in range mode')
 
     args = parser.parse_args()
+    if args.rate <= 0:
+        parser.error('--rate must be greater than 0')
+    if args.burst < 1:
+        parser.error('--burst must be at least 1')
+    for option, value in (('--workers', args.workers), ('--batch-size', args.batch_size),
+                          ('--chunk-days', args.chunk_days)):
+        if value < 1:
+            parser.error(f'{option} must be at least 1')
 
-    start_date_dt = datetime.strptime(args.start_date, '%Y-%m-%d')
-    end_date_dt = datetime.strptime(args.end_date, '%Y-%m-%d')
-    current_date_dt = start_date_dt
+    rate_limiter = TokenBucket(args.rate, args.burst)
 
     # Establish the MySQL connection once
     connection = mysql.connector.connect(
@@ -102,28 +260,39 @@ if __name__ == "__main__":
         port=3306,
         database=MYSQL_DB,
         user=MYSQL_USER,
-        password=MYSQL_PASSWORD
+        password=MYSQL_PASSWORD,
+        allow_local_infile=args.load_data
     )
 
-    while current_date_dt <= end_date_dt:
-        current_date_str = current_date_dt.strftime('%Y-%m-%d')
+    # Skip days that are already loaded before making any API call
+    dates = get_dates(args.start_date, args.end_date)
+    if args.force:
+        skipped_dates = set()
+    else:
+        refreshed_dates = set(dates[-args.refresh_last:]) if args.refresh_last > 0 else set()
+        skipped_dates = get_loaded_dates(connection, args.start_date, args.end_date) - refreshed_dates
+    if skipped_dates:
+        logging.info(f"Data for {len(skipped_dates)} dates already exists in the database. Skipping: "
+                     f"{', '.join(sorted(skipped_dates))}")
+    dates = [date for date in dates if date not in skipped_dates]
 
-        retries = 3
-        while retries > 0:
-            redtrack_data = fetch_redtrack_data(current_date_str, current_date_str)
+    # Days are fetched concurrently but written one at a time, in date order
+    run_started = time.perf_counter()
+    total_rows = 0
+    chunks = split_into_chunks(dates, args.chunk_days if args.range_mode else 1)
+    for chunk, data_by_date in fetch_chunks_in_order(chunks, args.workers, rate_limiter):
+        for current_date_str in chunk:
+            redtrack_data = data_by_date.get(current_date_str)
             if redtrack_data:
-                insert_data_into_mysql(connection, redtrack_data, current_date_str)
-                break
-            else:
-                logging.warning(f'No data found for date {current_date_str}. Retrying...')
-                retries -= 1
-                time.sleep(5)  # Wait for 5 seconds before retrying
+                total_rows += insert_data_into_mysql(connection, redtrack_data, current_date_str,
+                                                     args.batch_size, args.load_data)
+            elif len(chunk) > 1:
+                logging.warning(f'No data found for date {current_date_str} in range response')
 
-        if retries == 0:
-            logging.error(f'Failed to fetch data for date {current_date_str} after 3 attempts.')
-
-        current_date_dt += timedelta(days=1)
-        time.sleep(2)  # Delay to prevent hitting rate limits
+    run_elapsed = time.perf_counter() - run_started
+    http_client.log_stats()
+    logging.info(f"{total_rows} records inserted in {run_elapsed:.2f}s "
+                 f"({total_rows / max(run_elapsed, 1e-6):.0f} rows/sec end to end)")
 
     # Close the connection once at the end
     if connection.is_connected():
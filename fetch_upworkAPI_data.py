@@ -2,9 +2,21 @@ import requests
 import json
 import mysql.connector
 from mysql.connector import Error
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import argparse
+import fcntl
+import hashlib
 import logging
 import os
+import re
+import tempfile
+import threading
+import time
+from http_client import get_http_client
+from mysql_bulk import insert_rows_multirow, load_rows_from_file
+from retry_policy import RetryPolicy
 
 # Set up logging
 logger = logging.getLogger()
@@ -30,16 +42,62 @@ REFRESH_TOKEN = 'dummy'
 TOKEN_FILE = '/root/upworkData/access_token.txt'  # server
 GRAPHQL_API_URL = 'https://api.upwork.com/graphql'
 TOKEN_URL = 'https://www.upwork.com/api/v3/oauth2/token'
+# Refresh the access token this many seconds before it expires; tokens returned without
+# expires_in are assumed to live DEFAULT_TOKEN_LIFETIME seconds
+TOKEN_REFRESH_MARGIN = 300
+DEFAULT_TOKEN_LIFETIME = 3600
+
+# Upwork organizations to sync; each one is written to upwork_data with its organization_id
+ORGANIZATION_IDS = ['dummy']
+# Upper bound on concurrent Upwork API requests across all organizations and shards
+MAX_IN_FLIGHT_REQUESTS = 8
+# Backoff for transient API failures (connection errors, 429 and 5xx)
+retry_policy = RetryPolicy(max_attempts=5, base_delay=1.0, max_delay=30.0, total_timeout=180.0)
 
 MYSQL_HOST = 'dummy'
 MYSQL_DATABASE = 'dummy'
 MYSQL_USER = 'dummy'
 MYSQL_PASSWORD = 'dummy'
 
+# Number of edges requested per GraphQL page and number of rows per executemany call
+PAGE_SIZE = 500
+INSERT_CHUNK_SIZE = 1000
+
+# Backfill shard size ('day' or 'week') and number of (organization, date range) jobs run in parallel
+BACKFILL_SHARD = 'day'
+WORKERS = 4
+
+# 'incremental' applies only the inserts/updates/deletes needed to match the API,
+# 'replace' deletes the whole window and re-inserts it
+SYNC_MODE = 'incremental'
+
+# Writer used by the 'replace' sync mode: 'executemany' or 'load_data' (LOAD DATA LOCAL INFILE,
+# falling back to multi-row INSERTs of MULTI_ROW_INSERT_SIZE rows when the server refuses local infile)
+WRITER = 'executemany'
+MULTI_ROW_INSERT_SIZE = 1000
+
+# upwork_data columns, in insert order. A row's stable key is made of KEY_COLUMNS and
+# its content hash of the remaining VALUE_COLUMNS.
+UPWORK_COLUMNS = (
+    'organization_id', 'date', 'week', 'month', 'year', 'talent', 'team_name', 'contract_status',
+    'term_id', 'task', 'task_description', 'memo', 'total_hours_worked',
+    'total_online_hours_worked', 'total_offline_hours_worked'
+)
+KEY_COLUMNS = ('organization_id', 'date', 'talent', 'team_name', 'term_id', 'task', 'task_description', 'memo')
+VALUE_COLUMNS = tuple(column for column in UPWORK_COLUMNS if column not in KEY_COLUMNS)
+KEY_INDEXES = tuple(UPWORK_COLUMNS.index(column) for column in KEY_COLUMNS)
+VALUE_INDEXES = tuple(UPWORK_COLUMNS.index(column) for column in VALUE_COLUMNS)
+
+NUMERIC_PATTERN = re.compile(r'^-?\d+(\.\d+)?$')
+
+INSERT_COLUMNS_CLAUSE = f"INSERT INTO upwork_data ({', '.join(UPWORK_COLUMNS)}) VALUES "
+ROW_PLACEHOLDER = f"({', '.join(['%s'] * len(UPWORK_COLUMNS))})"
+INSERT_QUERY = INSERT_COLUMNS_CLAUSE + ROW_PLACEHOLDER
+
 # Define the GraphQL query with filter and pagination
 query = '''
-query contractTimeReport($filter: TimeReportFilter) {
-  contractTimeReport(filter: $filter) {
+query contractTimeReport($filter: TimeReportFilter, $pagination: Pagination) {
+  contractTimeReport(filter: $filter, pagination: $pagination) {
     edges {
       node {
         dateWorkedOn
@@ -64,185 +122,536 @@ query contractTimeReport($filter: TimeReportFilter) {
         totalOfflineHoursWorked
       }
     }
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
   }
 }
 '''
 
+# Pooled client shared by every thread, with at most MAX_IN_FLIGHT_REQUESTS requests in flight per host
+http_client = get_http_client('Upwork', max_per_host=MAX_IN_FLIGHT_REQUESTS)
+
 
 # Function to calculate the date range
 def get_date_range():
     end_date = datetime.today()
     start_date = end_date - timedelta(days=2)
     return start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
-    # return '2024-07-25', '2024-07-30'
 
 
-# Function to read the access token from file
-def read_access_token():
-    if os.path.exists(TOKEN_FILE):
-        with open(TOKEN_FILE, 'r') as file:
-            return file.read().strip()
-    return None
 
+# Function to split a date range into consecutive day or week shards (inclusive bounds)
+def split_date_range(start_date, end_date, shard=BACKFILL_SHARD):
+    step = timedelta(days=7 if shard == 'week' else 1)
+    shard_start = datetime.strptime(start_date, '%Y-%m-%d')
+    last_date = datetime.strptime(end_date, '%Y-%m-%d')
 
-# Function to write the access token to file
-def write_access_token(token):
-    with open(TOKEN_FILE, 'w') as file:
-        file.write(token)
+    shards = []
+    while shard_start <= last_date:
+        shard_end = min(shard_start + step - timedelta(days=1), last_date)
+        shards.append((shard_start.strftime('%Y-%m-%d'), shard_end.strftime('%Y-%m-%d')))
+        shard_start = shard_end + timedelta(days=1)
+    return shards
 
 
-# Function to refresh the access token
+# Function to read the access token and its expiry (epoch seconds, None if unknown) from file
+def read_access_token(token_file=TOKEN_FILE):
+    if os.path.exists(token_file):
+        with open(token_file, 'r') as file:
+            content = file.read().strip()
+        try:
+            stored = json.loads(content)
+        except ValueError:
+            stored = None
+        if isinstance(stored, dict):
+            return stored.get('access_token'), stored.get('expires_at')
+        # Plain token written by older versions of the script, expiry unknown
+        return content or None, None
+    return None, None
+
+
+# Function to write the access token and its expiry to file atomically
+def write_access_token(token, expires_at, token_file=TOKEN_FILE):
+    directory = os.path.dirname(os.path.abspath(token_file))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.access_token.')
+    try:
+        with os.fdopen(fd, 'w') as file:
+            json.dump({'access_token': token, 'expires_at': expires_at}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, token_file)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+# Function to refresh the access token, returns (access_token, expires_in) or (None, None)
 def refresh_access_token():
-    global ACCESS_TOKEN
     logger.info("Refreshing access token...")
     try:
-        response = requests.post(TOKEN_URL, data={
+        response = retry_policy.send(lambda: http_client.post(TOKEN_URL, data={
             'client_id': CLIENT_ID,
             'client_secret': CLIENT_SECRET,
             'refresh_token': REFRESH_TOKEN,
             'grant_type': 'refresh_token'
-        })
-        response.raise_for_status()
+        }), 'Upwork token refresh')
         tokens = response.json()
-        ACCESS_TOKEN = tokens['access_token']
-        write_access_token(ACCESS_TOKEN)
-        logger.info("Access token refreshed and saved successfully")
-        return True
+        logger.info("Access token refreshed successfully")
+        return tokens['access_token'], tokens.get('expires_in')
     except requests.exceptions.HTTPError as http_err:
         logger.error(f"HTTP error occurred while refreshing token: {http_err}")
     except Exception as err:
         logger.error(f"Error occurred while refreshing token: {err}")
-    return False
-
-
-# Fetch data from the GraphQL API
-def fetch_data():
-    global ACCESS_TOKEN
-
-    headers = {
-        'Authorization': f'Bearer {ACCESS_TOKEN}',
-        'Content-Type': 'application/json'
-    }
+    return None, None
+
+
+# Keeps the access token in memory and refreshes it before it expires. A thread lock makes
+# threads share a single refresh, and a file lock next to TOKEN_FILE does the same for
+# concurrent runs of the script.
+class TokenManager:
+    def __init__(self, token_file=TOKEN_FILE, refresh_margin=TOKEN_REFRESH_MARGIN):
+        self.token_file = token_file
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = None
+        self._rejected_token = None
+
+    # Return a token that is valid for at least refresh_margin seconds
+    def get_token(self):
+        with self._lock:
+            if not self._is_usable(self._token, self._expires_at):
+                self._load_or_refresh()
+            return self._token
+
+    # Mark a token rejected by the API (401) so the next get_token refreshes it, once
+    def invalidate(self, token):
+        with self._lock:
+            self._rejected_token = token
+            if token == self._token:
+                self._expires_at = None
+
+    def _is_usable(self, token, expires_at):
+        return (token is not None and token != self._rejected_token and expires_at is not None
+                and expires_at - self.refresh_margin > time.time())
+
+    def _load_or_refresh(self):
+        # Another process may already have refreshed the token
+        token, expires_at = read_access_token(self.token_file)
+        if self._is_usable(token, expires_at):
+            self._token, self._expires_at = token, expires_at
+            return
+
+        with open(f'{self.token_file}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Check again now that no other process is refreshing
+                token, expires_at = read_access_token(self.token_file)
+                if not self._is_usable(token, expires_at):
+                    token, expires_in = refresh_access_token()
+                    if token is None:
+                        raise RuntimeError("Unable to obtain an Upwork access token")
+                    expires_at = time.time() + (expires_in or DEFAULT_TOKEN_LIFETIME)
+                    write_access_token(token, expires_at, self.token_file)
+                    logger.info("Access token saved successfully")
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        self._token, self._expires_at = token, expires_at
+        self._rejected_token = None
+
+
+token_manager = TokenManager()
+
+
+# Send one GraphQL request, refreshing the token once on 401
+def post_graphql(payload):
+    for attempt in range(2):  # The second attempt only follows a 401
+        try:
+            access_token = token_manager.get_token()
+            headers = {
+                'Authorization': f'Bearer {access_token}',
+                'Content-Type': 'application/json'
+            }
+
+            response = retry_policy.send(
+                lambda: http_client.post(GRAPHQL_API_URL, headers=headers, data=json.dumps(payload)),
+                'Upwork GraphQL request')
+            result = response.json()
+            if result.get('errors'):
+                logger.error(f"GraphQL error returned by Upwork API: {result['errors']}")
+                return None
+            return result
+        except requests.exceptions.HTTPError as http_err:
+            if http_err.response is not None and http_err.response.status_code == 401 and attempt == 0:
+                # Unauthorized, possibly expired token
+                logger.error(f"Unauthorized error, attempting to refresh token: {http_err}")
+                token_manager.invalidate(access_token)
+                continue  # Retry with new token
+            logger.error(f"HTTP error occurred: {http_err}")
+        except Exception as err:
+            logger.error(f"Other error occurred: {err}")
+        break
+    logger.error("Failed to fetch data from Upwork API.")
+    return None
 
-    start_date, end_date = get_date_range()
-    # logger.info(f"Fetching data from Upwork API for the date range: {start_date} to {end_date}")
 
+# Fetch data from the GraphQL API page by page, yielding the edges of each page
+def fetch_data(organization_id, start_date, end_date):
     filter_params = {
-        "organizationId_eq": "dummy",
+        "organizationId_eq": organization_id,
         "timeReportDate_bt": {
             "rangeStart": start_date,
             "rangeEnd": end_date
         }
     }
 
-    variables = {
-        'filter': filter_params
-    }
-    payload = {
-        'query': query,
-        'variables': variables
-    }
+    cursor = None
+    page_number = 0
+    while True:
+        pagination = {'first': PAGE_SIZE}
+        if cursor:
+            pagination['after'] = cursor
+
+        payload = {
+            'query': query,
+            'variables': {
+                'filter': filter_params,
+                'pagination': pagination
+            }
+        }
 
-    for attempt in range(5):  # Retry up to 5 times
-        try:
-            response = requests.post(GRAPHQL_API_URL, headers=headers, data=json.dumps(payload))
-            response.raise_for_status()
-            result = response.json()
-            logger.info(f"Data fetched successfully from Upwork API: {start_date} to {end_date}")
-            return result
-        except requests.exceptions.HTTPError as http_err:
-            if response.status_code == 401:  # Unauthorized, possibly expired token
-                logger.error(f"Unauthorized error, attempting to refresh token: {http_err}")
-                if refresh_access_token():
-                    headers['Authorization'] = f'Bearer {ACCESS_TOKEN}'
-                    continue  # Retry with new token
-            logger.error(f"HTTP error occurred: {http_err}")
-        except Exception as err:
-            logger.error(f"Other error occurred: {err}")
-        if attempt == 4:
-            logger.error("Failed to fetch data after multiple attempts.")
+        result = post_graphql(payload)
+        if not result or not result.get('data') or not result['data'].get('contractTimeReport'):
+            # Raising lets the caller roll back whatever was written for this range
+            raise RuntimeError(f"Failed to fetch page {page_number + 1} from Upwork API for organization "
+                               f"{organization_id}: {start_date} to {end_date}")
+
+        report = result['data']['contractTimeReport']
+        edges = report.get('edges') or []
+        page_number += 1
+        logger.info(f"Fetched page {page_number} ({len(edges)} rows) from Upwork API for organization "
+                    f"{organization_id}: {start_date} to {end_date}")
+        yield edges
+
+        page_info = report.get('pageInfo') or {}
+        cursor = page_info.get('endCursor')
+        if not page_info.get('hasNextPage') or not cursor:
             break
-    return None
 
 
-# Store data in MySQL
-def store_data_in_mysql(data):
-    if data and 'data' in data and 'contractTimeReport' in data['data']:
-        try:
-            connection = mysql.connector.connect(
-                host=MYSQL_HOST,
-                database=MYSQL_DATABASE,
-                user=MYSQL_USER,
-                password=MYSQL_PASSWORD
-            )
-
-            if connection.is_connected():
-                cursor = connection.cursor()
-                start_date, end_date = get_date_range()
-
-                # Remove existing data for the date range
-                # logger.info(f"Deleting existing data from database for the date range: {start_date} to {end_date}")
-                delete_query = """
-                DELETE FROM upwork_data WHERE date BETWEEN %s AND %s
-                """
-                cursor.execute(delete_query, (start_date, end_date))
-                connection.commit()
-                logger.info("Existing data deleted successfully")
-
-                # Insert new data
-                insert_query = """
-                 INSERT INTO upwork_data (
-                    date, week, month, year, talent, team_name, contract_status, 
-                    term_id, task, task_description, memo, total_hours_worked, 
-                    total_online_hours_worked, total_offline_hours_worked
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """
-
-                edges = data['data']['contractTimeReport']['edges']
-                values = [
-                    (
-                        edge['node']['dateWorkedOn'],
-                        edge['node']['weekWorkedOn'],
-                        edge['node']['monthWorkedOn'],
-                        edge['node']['yearWorkedOn'],
-                        edge['node']['freelancer']['name'],
-                        edge['node']['team']['name'] if edge['node']['team'] else None,
-                        edge['node']['contract']['status'] if edge['node']['contract'] else None,
-                        edge['node']['termId'],
-                        edge['node']['task'],
-                        edge['node']['taskDescription'],
-                        edge['node']['memo'],
-                        edge['node']['totalHoursWorked'],
-                        edge['node']['totalOnlineHoursWorked'],
-                        edge['node']['totalOfflineHoursWorked'],
-                    )
-                    for edge in edges
-                ]
-
-                cursor.executemany(insert_query, values)
-                connection.commit()
-                logger.info("Data inserted successfully into the database")
-
-        except Error as e:
-            logger.error(f"Error while connecting to MySQL: {e}")
-        finally:
-            if connection.is_connected():
+# Convert a contractTimeReport node into an upwork_data row
+def build_row(organization_id, node):
+    return (
+        organization_id,
+        node['dateWorkedOn'],
+        node['weekWorkedOn'],
+        node['monthWorkedOn'],
+        node['yearWorkedOn'],
+        node['freelancer']['name'],
+        node['team']['name'] if node['team'] else None,
+        node['contract']['status'] if node['contract'] else None,
+        node['termId'],
+        node['task'],
+        node['taskDescription'],
+        node['memo'],
+        node['totalHoursWorked'],
+        node['totalOnlineHoursWorked'],
+        node['totalOfflineHoursWorked'],
+    )
+
+
+# Open a MySQL connection with the script configuration
+def connect_mysql(allow_local_infile=False):
+    return mysql.connector.connect(
+        host=MYSQL_HOST,
+        database=MYSQL_DATABASE,
+        user=MYSQL_USER,
+        password=MYSQL_PASSWORD,
+        allow_local_infile=allow_local_infile
+    )
+
+
+# Store data in MySQL, inserting each fetched page in bounded chunks
+def store_data_in_mysql(organization_id, pages, start_date, end_date):
+    connection = None
+    cursor = None
+    try:
+        connection = connect_mysql()
+
+        if connection.is_connected():
+            cursor = connection.cursor()
+
+            # Remove existing data for the date range. The delete and the inserts share one
+            # transaction, so readers keep seeing the old rows until the whole range is loaded.
+            # logger.info(f"Deleting existing data from database for the date range: {start_date} to {end_date}")
+            delete_query = """
+            DELETE FROM upwork_data WHERE organization_id = %s AND date BETWEEN %s AND %s
+            """
+            cursor.execute(delete_query, (organization_id, start_date, end_date))
+
+            total_rows = 0
+            for edges in pages:
+                for i in range(0, len(edges), INSERT_CHUNK_SIZE):
+                    values = [build_row(organization_id, edge['node']) for edge in edges[i:i + INSERT_CHUNK_SIZE]]
+                    cursor.executemany(INSERT_QUERY, values)
+                    total_rows += len(values)
+
+            connection.commit()
+            logger.info(f"{total_rows} rows inserted successfully into the database for organization "
+                        f"{organization_id}: {start_date} to {end_date}")
+            return True
+
+    except Error as e:
+        logger.error(f"Error while connecting to MySQL: {e}")
+    except Exception as e:
+        logger.error(f"Error while storing data in MySQL: {e}")
+    finally:
+        if connection is not None and connection.is_connected():
+            connection.rollback()  # No-op after a successful commit
+            if cursor is not None:
+                cursor.close()
+            connection.close()
+            logger.info("MySQL connection is closed")
+    return False
+
+
+# Store data in MySQL with LOAD DATA LOCAL INFILE, streaming the rows through a temporary TSV file
+def bulk_load_data_in_mysql(organization_id, pages, start_date, end_date, local_infile=True):
+    connection = None
+    cursor = None
+    try:
+        connection = connect_mysql(allow_local_infile=local_infile)
+
+        if connection.is_connected():
+            cursor = connection.cursor()
+
+            if local_infile:
+                cursor.execute("SELECT @@GLOBAL.local_infile")
+                local_infile = bool(int(cursor.fetchone()[0]))
+                if not local_infile:
+                    logger.warning("local_infile is disabled on the server, using multi-row INSERTs")
+
+            # Same transactional delete as store_data_in_mysql
+            delete_query = """
+            DELETE FROM upwork_data WHERE organization_id = %s AND date BETWEEN %s AND %s
+            """
+            cursor.execute(delete_query, (organization_id, start_date, end_date))
+
+            rows = (build_row(organization_id, edge['node']) for edges in pages for edge in edges)
+            if local_infile:
+                total_rows = load_rows_from_file(cursor, 'upwork_data', UPWORK_COLUMNS, rows, MULTI_ROW_INSERT_SIZE)
+            else:
+                total_rows = insert_rows_multirow(cursor, 'upwork_data', UPWORK_COLUMNS, rows, MULTI_ROW_INSERT_SIZE)
+
+            connection.commit()
+            logger.info(f"{total_rows} rows bulk loaded successfully into the database for organization "
+                        f"{organization_id}: {start_date} to {end_date}")
+            return True
+
+    except Error as e:
+        logger.error(f"Error while connecting to MySQL: {e}")
+    except Exception as e:
+        logger.error(f"Error while bulk loading data into MySQL: {e}")
+    finally:
+        if connection is not None and connection.is_connected():
+            connection.rollback()  # No-op after a successful commit
+            if cursor is not None:
                 cursor.close()
-                connection.close()
-                logger.info("MySQL connection is closed")
+            connection.close()
+            logger.info("MySQL connection is closed")
+    return False
+
+
+# Normalize an API or MySQL value column so both sides compare equal (dates, Decimal vs float vs str)
+def normalize_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f'{float(value):.4f}'
+    value = str(value).strip()
+    if NUMERIC_PATTERN.match(value):
+        return f'{float(value):.4f}'
+    return value
+
+
+# Normalize an API or MySQL key value as a string, so distinct identifiers never collapse into one key
+def normalize_key_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%Y-%m-%d')
+    return str(value).strip()
+
+
+# Stable key of an upwork_data row
+def row_key(row):
+    return tuple(normalize_key_value(row[i]) for i in KEY_INDEXES)
+
+
+# Distinct raw (as stored) keys of a group of upwork_data rows, in order
+def raw_keys(rows):
+    return list(dict.fromkeys(tuple(row[i] for i in KEY_INDEXES) for row in rows))
+
+
+# Content hash of the non-key columns of an upwork_data row
+def row_hash(row):
+    content = '\x1f'.join(normalize_value(row[i]) for i in VALUE_INDEXES)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+# Group rows by stable key; a key can repeat, so each group keeps all of its rows
+def group_rows(rows):
+    groups = {}
+    for row in rows:
+        groups.setdefault(row_key(row), []).append(row)
+    return groups
+
+
+# Apply only the inserts, updates and deletes needed to make the window match the API
+def sync_data_in_mysql(organization_id, pages, start_date, end_date):
+    connection = None
+    cursor = None
+    try:
+        # Read the API side first so a failed download never touches the table
+        new_groups = group_rows(build_row(organization_id, edge['node']) for edges in pages for edge in edges)
+
+        connection = connect_mysql()
+
+        if connection.is_connected():
+            cursor = connection.cursor()
+
+            select_query = f"""
+            SELECT {', '.join(UPWORK_COLUMNS)} FROM upwork_data
+            WHERE organization_id = %s AND date BETWEEN %s AND %s
+            """
+            cursor.execute(select_query, (organization_id, start_date, end_date))
+            stored_groups = group_rows(cursor.fetchall())
+
+            key_condition = ' AND '.join(f'{column} <=> %s' for column in KEY_COLUMNS)
+            update_query = f"""
+            UPDATE upwork_data SET {', '.join(f'{column} = %s' for column in VALUE_COLUMNS)}
+            WHERE {key_condition}
+            """
+            delete_query = f"""
+            DELETE FROM upwork_data WHERE {key_condition}
+            """
+
+            inserts, updates, deletes = [], [], []
+            for key, new_rows in new_groups.items():
+                stored_rows = stored_groups.pop(key, None)
+                if stored_rows is None:
+                    inserts.extend(new_rows)
+                elif sorted(map(row_hash, stored_rows)) == sorted(map(row_hash, new_rows)):
+                    continue
+                elif len(stored_rows) == 1 and len(new_rows) == 1:
+                    stored_key = tuple(stored_rows[0][i] for i in KEY_INDEXES)
+                    updates.append(tuple(new_rows[0][i] for i in VALUE_INDEXES) + stored_key)
+                else:
+                    # Repeated key whose rows changed: replace the whole group
+                    deletes.extend(raw_keys(stored_rows))
+                    inserts.extend(new_rows)
+            # Whatever is left in the window no longer exists upstream
+            for stored_rows in stored_groups.values():
+                deletes.extend(raw_keys(stored_rows))
+
+            for i in range(0, len(deletes), INSERT_CHUNK_SIZE):
+                cursor.executemany(delete_query, deletes[i:i + INSERT_CHUNK_SIZE])
+            for i in range(0, len(updates), INSERT_CHUNK_SIZE):
+                cursor.executemany(update_query, updates[i:i + INSERT_CHUNK_SIZE])
+            for i in range(0, len(inserts), INSERT_CHUNK_SIZE):
+                cursor.executemany(INSERT_QUERY, inserts[i:i + INSERT_CHUNK_SIZE])
+
+            connection.commit()
+            logger.info(f"Incremental sync of organization {organization_id} {start_date} to {end_date}: "
+                        f"{len(inserts)} inserted, "
+                        f"{len(updates)} updated, {len(deletes)} keys deleted")
+            return True
+
+    except Error as e:
+        logger.error(f"Error while connecting to MySQL: {e}")
+    except Exception as e:
+        logger.error(f"Error while syncing data in MySQL: {e}")
+    finally:
+        if connection is not None and connection.is_connected():
+            connection.rollback()  # No-op after a successful commit
+            if cursor is not None:
+                cursor.close()
+            connection.close()
+            logger.info("MySQL connection is closed")
+    return False
+
+
+# Fetch one organization's date range and write it to MySQL as soon as it is complete
+def sync_date_range(organization_id, start_date, end_date, sync_mode=SYNC_MODE, writer=WRITER):
+    pages = fetch_data(organization_id, start_date, end_date)
+    if sync_mode == 'incremental':
+        return sync_data_in_mysql(organization_id, pages, start_date, end_date)
+    if writer == 'load_data':
+        return bulk_load_data_in_mysql(organization_id, pages, start_date, end_date)
+    return store_data_in_mysql(organization_id, pages, start_date, end_date)
+
+
+# Sync every (organization, date range) pair in parallel, each job with its own MySQL connection
+def run_sync(organization_ids, date_ranges, workers=WORKERS, sync_mode=SYNC_MODE, writer=WRITER):
+    jobs = [(organization_id, start_date, end_date)
+            for organization_id in organization_ids
+            for start_date, end_date in date_ranges]
+    logger.info(f"Syncing {len(organization_ids)} organizations x {len(date_ranges)} date ranges "
+                f"with {workers} workers")
+
+    failed_jobs = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(sync_date_range, *job, sync_mode, writer): job for job in jobs}
+        for future in as_completed(futures):
+            organization_id, start_date, end_date = futures[future]
+            try:
+                succeeded = future.result()
+            except Exception as err:
+                logger.error(f"Organization {organization_id} {start_date} to {end_date} failed: {err}")
+                succeeded = False
+            if not succeeded:
+                failed_jobs.append(futures[future])
+
+    if failed_jobs:
+        logger.error(f"{len(failed_jobs)} of {len(jobs)} jobs failed: {sorted(failed_jobs)}")
     else:
-        logger.warning("Data is missing or in unexpected format")
+        logger.info(f"All {len(jobs)} jobs stored successfully")
+    return failed_jobs
 
 
 # Main function to execute the script
 if __name__ == "__main__":
-    logger.info("Script execution started")
+    parser = argparse.ArgumentParser(description='Fetch Upwork time reports and store them in MySQL.')
+    parser.add_argument('--start-date', help='Backfill start date in YYYY-MM-DD format')
+    parser.add_argument('--end-date', help='Backfill end date in YYYY-MM-DD format')
+    parser.add_argument('--shard', choices=['day', 'week'], default=BACKFILL_SHARD,
+                        help='Size of the date windows fetched in parallel during a backfill')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help='Number of (organization, date range) jobs run in parallel')
+    parser.add_argument('--org-ids', nargs='+', default=ORGANIZATION_IDS,
+                        help='Upwork organization IDs to sync')
+    parser.add_argument('--sync-mode', choices=['incremental', 'replace'], default=SYNC_MODE,
+                        help='Apply only the row changes (incremental) or delete and re-insert the window (replace)')
+    parser.add_argument('--writer', choices=['executemany', 'load_data'], default=WRITER,
+                        help='How the replace sync mode inserts rows; load_data uses LOAD DATA LOCAL INFILE')
+    args = parser.parse_args()
+
+    if bool(args.start_date) != bool(args.end_date):
+        parser.error('--start-date and --end-date must be given together')
 
-    # Read the access token from file
-    ACCESS_TOKEN = read_access_token() or ACCESS_TOKEN
+    logger.info("Script execution started")
 
-    graphQL_data = fetch_data()
-    if graphQL_data:
-        store_data_in_mysql(graphQL_data)
+    if args.start_date:
+        date_ranges = split_date_range(args.start_date, args.end_date, args.shard)
+    else:
+        date_ranges = [get_date_range()]
+    run_sync(args.org_ids, date_ranges, args.workers, args.sync_mode, args.writer)
 
+    http_client.log_stats()
     logger.info("Script execution finished")
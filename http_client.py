@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeout in seconds applied to every request that does not pass its own
+DEFAULT_TIMEOUT = (10.0, 120.0)
+# Concurrent requests allowed per host, which is also the number of pooled connections kept per host
+DEFAULT_MAX_PER_HOST = 8
+
+
+# A pooled requests.Session for one integration: keep-alive connections, gzip, a default timeout and at
+# most max_per_host requests in flight per host. Every request is timed; the totals are kept per client
+# and each hook is called as hook(name, method, url, status_code, elapsed) (status_code is None when the
+# request raised). Retries are left to RetryPolicy, which wraps calls to this client.
+class HttpClient:
+    def __init__(self, name, timeout=DEFAULT_TIMEOUT, max_per_host=DEFAULT_MAX_PER_HOST, headers=None, hooks=None):
+        self.name = name
+        self.timeout = timeout
+        self.max_per_host = max_per_host
+        self.hooks = list(hooks or [])
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_per_host)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+        if headers:
+            self.session.headers.update(headers)
+
+        self.request_count = 0
+        self.error_count = 0
+        self.total_time = 0.0
+        self._host_limits = {}
+        self._lock = threading.Lock()
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            limit = self._host_limits.get(host)
+            if limit is None:
+                limit = self._host_limits[host] = threading.BoundedSemaphore(self.max_per_host)
+        return limit
+
+    def _record(self, method, url, status_code, elapsed):
+        with self._lock:
+            self.request_count += 1
+            self.total_time += elapsed
+            if status_code is None or status_code >= 400:
+                self.error_count += 1
+        for hook in self.hooks:
+            try:
+                hook(self.name, method, url, status_code, elapsed)
+            except Exception as e:
+                logger.warning(f"{self.name} HTTP timing hook failed: {e}")
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        with self._host_limit(url):
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException:
+                self._record(method, url, None, time.monotonic() - started)
+                raise
+        self._record(method, url, response.status_code, time.monotonic() - started)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def log_stats(self):
+        average = self.total_time / self.request_count * 1000 if self.request_count else 0.0
+        logger.info(f"{self.name} HTTP: {self.request_count} requests ({self.error_count} failed), "
+                    f"{self.total_time:.1f}s total, {average:.0f} ms average.")
+
+
+http_clients = {}
+http_clients_lock = threading.Lock()
+
+
+# The shared client of an integration, created with the given options on first use
+def get_http_client(name, **kwargs):
+    with http_clients_lock:
+        client = http_clients.get(name)
+        if client is None:
+            client = http_clients[name] = HttpClient(name, **kwargs)
+        return client
@@ -0,0 +1,109 @@
+import logging
+import os
+import tempfile
+
+from mysql.connector import Error
+
+logger = logging.getLogger(__name__)
+
+# MySQL errors meaning LOAD DATA LOCAL INFILE is disabled on the server or the client
+LOCAL_INFILE_DISABLED_ERRNOS = (1148, 2068, 3948)
+# Rows per multi-row INSERT unless the caller passes its own batch_size
+MULTI_ROW_INSERT_SIZE = 1000
+
+
+# Escape a value for the default LOAD DATA format (tab separated, backslash escaped, \N for NULL)
+def to_tsv_field(value):
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+# Reverse of to_tsv_field
+def from_tsv_field(field):
+    if field == '\\N':
+        return None
+    if '\\' not in field:
+        return field
+    unescaped = {'t': '\t', 'n': '\n', 'r': '\r'}
+    chars = []
+    escaped = False
+    for char in field:
+        if escaped:
+            chars.append(unescaped.get(char, char))
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        else:
+            chars.append(char)
+    return ''.join(chars)
+
+
+# Write rows to a temporary TSV file in the LOAD DATA format and return its path; the caller removes it
+def write_tsv_file(rows):
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='\n', suffix='.tsv', delete=False) as tsv_file:
+        for row in rows:
+            tsv_file.write('\t'.join(to_tsv_field(value) for value in row))
+            tsv_file.write('\n')
+    return tsv_file.name
+
+
+# Read back the rows written by write_tsv_file
+def read_tsv_rows(path):
+    with open(path, 'r', encoding='utf-8', newline='\n') as file:
+        for line in file:
+            yield tuple(from_tsv_field(field) for field in line.rstrip('\n').split('\t'))
+
+
+# Insert rows into table with multi-row INSERT statements of up to batch_size rows each
+def insert_rows_multirow(cursor, table, columns, rows, batch_size=MULTI_ROW_INSERT_SIZE):
+    insert_clause = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+    row_placeholder = f"({', '.join(['%s'] * len(columns))})"
+    total_rows = 0
+    batch = []
+    for row in rows:
+        batch.extend(row)
+        if len(batch) >= batch_size * len(columns):
+            total_rows += execute_multirow_insert(cursor, insert_clause, row_placeholder, batch, len(columns))
+            batch = []
+    if batch:
+        total_rows += execute_multirow_insert(cursor, insert_clause, row_placeholder, batch, len(columns))
+    return total_rows
+
+
+# Execute one multi-row INSERT for a flat list of row values
+def execute_multirow_insert(cursor, insert_clause, row_placeholder, values, column_count):
+    row_count = len(values) // column_count
+    cursor.execute(insert_clause + ', '.join([row_placeholder] * row_count), values)
+    return row_count
+
+
+# Load a file written by write_tsv_file into table with LOAD DATA LOCAL INFILE and return the row count.
+# When the server or the client refuses local infile, the file is read back and inserted with multi-row
+# INSERTs of batch_size rows instead; any other MySQL error is raised.
+def load_tsv_file(cursor, table, columns, path, batch_size=MULTI_ROW_INSERT_SIZE):
+    load_query = f"""
+    LOAD DATA LOCAL INFILE %s INTO TABLE {table}
+    CHARACTER SET utf8mb4
+    FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+    LINES TERMINATED BY '\\n'
+    ({', '.join(columns)})
+    """
+    try:
+        cursor.execute(load_query, (path,))
+        return cursor.rowcount
+    except Error as e:
+        if e.errno not in LOCAL_INFILE_DISABLED_ERRNOS:
+            raise
+        logger.warning(f"LOAD DATA LOCAL INFILE refused ({e}), using multi-row INSERTs")
+        return insert_rows_multirow(cursor, table, columns, read_tsv_rows(path), batch_size)
+
+
+# Load rows through a temporary TSV file with load_tsv_file, removing the file afterwards
+def load_rows_from_file(cursor, table, columns, rows, batch_size=MULTI_ROW_INSERT_SIZE):
+    tsv_path = write_tsv_file(rows)
+    try:
+        return load_tsv_file(cursor, table, columns, tsv_path, batch_size)
+    finally:
+        os.remove(tsv_path)
@@ -0,0 +1,79 @@
+import email.utils
+import logging
+import random
+import time
+from datetime import datetime, timezone
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying, and the ones whose Retry-After header is honoured
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+RETRY_AFTER_STATUS_CODES = frozenset({429, 503})
+
+
+# Parse a Retry-After header (delta seconds or HTTP date) into seconds, None if absent or invalid
+def parse_retry_after(response):
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+# Retries transient HTTP failures with exponential backoff and full jitter, honouring Retry-After
+# on 429/503, within max_attempts and a total time budget of total_timeout seconds. Connection
+# errors, timeouts and RETRYABLE_STATUS_CODES are retried; any other error status is raised at once.
+class RetryPolicy:
+    def __init__(self, max_attempts=5, base_delay=1.0, max_delay=60.0, total_timeout=300.0,
+                 retryable_status_codes=RETRYABLE_STATUS_CODES):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.total_timeout = total_timeout
+        self.retryable_status_codes = retryable_status_codes
+
+    # Seconds to wait before the next attempt
+    def get_delay(self, attempt, response=None):
+        if response is not None and response.status_code in RETRY_AFTER_STATUS_CODES:
+            retry_after = parse_retry_after(response)
+            if retry_after is not None:
+                return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    # Call send() until it returns a successful response; raises the last error when giving up
+    def send(self, send, description='request'):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            response = None
+            try:
+                response = send()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+                error = err
+            else:
+                if response.status_code not in self.retryable_status_codes:
+                    response.raise_for_status()  # Fatal statuses are not retried
+                    return response
+                error = requests.exceptions.HTTPError(
+                    f"{response.status_code} Error: {response.reason} for url: {response.url}", response=response)
+
+            delay = self.get_delay(attempt, response)
+            elapsed = time.monotonic() - started
+            if attempt >= self.max_attempts or elapsed + delay > self.total_timeout:
+                logger.error(f"Giving up on {description} after {attempt} attempts and {elapsed:.1f}s: {error}")
+                raise error
+
+            logger.warning(f"{description} failed (attempt {attempt}/{self.max_attempts}): {error}. "
+                           f"Retrying in {delay:.1f}s")
+            time.sleep(delay)
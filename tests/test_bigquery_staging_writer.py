@@ -0,0 +1,65 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+bigquery = pytest.importorskip('google.cloud.bigquery')
+bq = pytest.importorskip('fetch_bigquery_data')
+
+# LoadJobStagingWriter offline: a fake client records the NDJSON file and job config of every load job.
+
+
+class FakeLoadJob:
+    job_id = 'fake-load-job'
+
+    def result(self):
+        return self
+
+
+class FakeClient:
+    def __init__(self):
+        self.loads = []
+
+    def load_table_from_file(self, file, destination, job_config=None):
+        self.loads.append({'data': file.read(), 'destination': destination, 'job_config': job_config})
+        return FakeLoadJob()
+
+
+def staging_row(i):
+    return bq.StagingRow(
+        '2024-03-01', '2024-03-01', 'USD', str(1000 + i), f'account_{i}', str(i), f'ad set {i}', '7', 'campaign',
+        1.25, '01:00:00', '2024-03-01T04:00:00-05:00', 'America/New_York', '2024-03-01T01:00:00-08:00',
+        '01:00:00 - 01:59:59')
+
+
+def test_one_load_job_per_run_with_all_rows():
+    client = FakeClient()
+    writer = bq.LoadJobStagingWriter(client, 'project.dataset.staging_run')
+    batches = [[staging_row(i) for i in range(3)], [staging_row(i) for i in range(3, 5)]]
+    for batch in batches:
+        writer.write_rows(batch)
+    assert client.loads == []  # Nothing is sent before finish()
+
+    writer.finish()
+
+    assert len(client.loads) == 1
+    load = client.loads[0]
+    assert load['destination'] == 'project.dataset.staging_run'
+    job_config = load['job_config']
+    assert job_config.source_format == bigquery.SourceFormat.NEWLINE_DELIMITED_JSON
+    assert job_config.write_disposition == bigquery.WriteDisposition.WRITE_APPEND
+    assert [field.name for field in job_config.schema] == [field.name for field in bq.staging_schema]
+    lines = load['data'].decode('utf-8').splitlines()
+    assert [json.loads(line) for line in lines] == [row._asdict() for batch in batches for row in batch]
+
+
+def test_finish_without_rows_makes_no_call():
+    client = FakeClient()
+    writer = bq.LoadJobStagingWriter(client)
+
+    writer.finish()
+
+    assert client.loads == []